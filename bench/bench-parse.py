@@ -0,0 +1,121 @@
+"""Benchmark how long the scheduler takes to parse the DAG file.
+
+The DAG processor re-parses ``dags/my-bi.py`` in a fresh child process on
+every loop, after pre-importing the ``airflow`` modules the file imports
+(``[scheduler] parsing_pre_import_modules``). Each parse is timed the same
+way: a new process imports those modules first, then only the parse of the
+DAG file is timed.
+
+The pipeline manifest (``bi_etl/pipeline.json``) is grown with ``--tables``
+synthetic plain dimensions, copies of Customer_Dim, to show how parse time
+scales as warehouse tables are added. The report also says whether parsing
+imported pandas, which the DAG file should leave to the task callables.
+
+Examples:
+    python bench/bench-parse.py
+    python bench/bench-parse.py --tables 0 10 50 200 --repeat 7 --output parse.json
+    git show HEAD~1:dags/my-bi.py > /tmp/my-bi-old.py && python bench/bench-parse.py --dag-file /tmp/my-bi-old.py --tables 0
+
+Run it with a Python that has Airflow installed (or pass ``--python``).
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DAGS_DIR = os.path.join(ROOT, "dags")
+sys.path.insert(0, DAGS_DIR)
+
+from bi_etl.pipeline import load_pipeline
+
+# Runs in the child process: Airflow is imported before the timer starts, as in the DAG processor
+PARSE = """
+import importlib, json, sys, tempfile, time
+from airflow.models.dagbag import DagBag
+from airflow.utils.file import iter_airflow_imports
+for module in iter_airflow_imports(sys.argv[1]):
+    importlib.import_module(module)
+dagbag = DagBag(dag_folder=tempfile.mkdtemp(), include_examples=False)
+modules = set(sys.modules)
+start = time.perf_counter()
+dags = dagbag.process_file(sys.argv[1], only_if_updated=False)
+seconds = time.perf_counter() - start
+print(json.dumps({
+    "seconds": seconds,
+    "dags": len(dags),
+    "tasks": sum(len(dag.tasks) for dag in dags),
+    "errors": {path: str(error) for path, error in dagbag.import_errors.items()},
+    "modules_imported": len(set(sys.modules) - modules),
+    "pandas_imported": "pandas" in sys.modules,
+}))
+"""
+
+
+def grown_pipeline(extra_tables):
+    """The pipeline manifest with ``extra_tables`` more plain dimensions."""
+    pipeline = load_pipeline()
+    template = pipeline['warehouse_tables']['Customer_Dim']
+    for i in range(extra_tables):
+        pipeline['warehouse_tables'][f"Bench_{i}_Dim"] = dict(template)
+    return pipeline
+
+
+def time_parse(python, dag_file, config, repeat):
+    """Parse ``dag_file`` ``repeat`` times, each in a new process, and return the timings."""
+    env = dict(os.environ, BI_PIPELINE_CONFIG=config, PYTHONPATH=DAGS_DIR)
+    env.setdefault("AIRFLOW__CORE__LOAD_EXAMPLES", "false")
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([python, "-c", PARSE, dag_file], env=env, check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    if runs[0]["errors"]:
+        raise RuntimeError(f"{dag_file} failed to parse: {runs[0]['errors']}")
+    seconds = [run["seconds"] for run in runs]
+    return {
+        "median_ms": statistics.median(seconds) * 1000,
+        "min_ms": min(seconds) * 1000,
+        "tasks": runs[0]["tasks"],
+        "modules_imported": runs[0]["modules_imported"],
+        "pandas_imported": runs[0]["pandas_imported"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the parse time of the BI DAG file.")
+    parser.add_argument("--tables", type=int, nargs="+", default=[0, 10, 50, 200],
+                        help="numbers of synthetic warehouse tables to add to the manifest (default: 0 10 50 200)")
+    parser.add_argument("--repeat", type=int, default=5, help="parses per table count; the median is reported (default: 5)")
+    parser.add_argument("--dag-file", default=os.path.join(DAGS_DIR, "my-bi.py"), help="DAG file to parse (default: dags/my-bi.py)")
+    parser.add_argument("--python", default=sys.executable, help="Python interpreter with Airflow installed")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bi-parse-") as workdir:
+        for extra_tables in args.tables:
+            config = os.path.join(workdir, f"pipeline-{extra_tables}.json")
+            with open(config, "w") as f:
+                json.dump(grown_pipeline(extra_tables), f)
+            result = time_parse(args.python, os.path.abspath(args.dag_file), config, args.repeat)
+            results[extra_tables] = result
+            logging.info(
+                f"+{extra_tables:<4} tables {result['tasks']:>5} tasks {result['median_ms']:>9.1f} ms median "
+                f"{result['min_ms']:>9.1f} ms min  {result['modules_imported']:>5} modules imported"
+                + ("  (imports pandas)" if result['pandas_imported'] else "")
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"dag_file": args.dag_file, "repeat": args.repeat, "results": results}, f, indent=2)
+        logging.info(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Synthetic ORION source data for benchmarking the pipeline.
+
+:func:`generate` builds every table in the DAG's ``tables_mysql_source`` list
+with the columns the transforms read. Keys are consistent across tables:
+``order_item`` rows point at existing ``orders``, orders at existing customers
+and employees, and customers at existing streets. Everything is sized from the
+number of order items and drawn from a seeded generator, so two runs with the
+same arguments produce identical tables.
+"""
+import numpy as np
+import pandas as pd
+
+CONTINENTS = ['Africa', 'Asia', 'Australia/Pacific', 'Europe', 'North America', 'South America']
+COUNTRIES = ['AU', 'BE', 'CA', 'DE', 'DK', 'ES', 'FR', 'GB', 'IL', 'IT', 'NL', 'TR', 'US', 'ZA']
+STATES_PER_COUNTRY = 4
+ITEMS_PER_ORDER = 2.5
+
+
+def parse_scale(value):
+    """Parse an order item count such as ``10000``, ``10k`` or ``1M``."""
+    value = str(value).strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    if multiplier != 1:
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+def _sizes(order_items):
+    orders = max(1, int(order_items / ITEMS_PER_ORDER))
+    return {
+        'orders': orders,
+        'customers': max(50, orders // 20),
+        'employees': max(20, orders // 200),
+        'products': max(50, min(orders // 10, 50_000)),
+        'suppliers': 60,
+        'cities': max(30, min(orders // 100, 20_000)),
+        'streets': max(100, min(orders // 10, 200_000)),
+    }
+
+
+def _names(prefix, ids):
+    return pd.Series(ids).map(lambda i: f"{prefix} {i}")
+
+
+def _dates(rng, start, days, n):
+    return pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, n), unit='D')
+
+
+def generate(order_items, seed=0):
+    """Return ``{table: DataFrame}`` for every ORION source table at ``order_items`` scale."""
+    rng = np.random.default_rng(seed)
+    n = _sizes(order_items)
+    tables = {}
+
+    tables['continent'] = pd.DataFrame({
+        'Continent_ID': np.arange(91, 91 + len(CONTINENTS)),
+        'Continent_Name': CONTINENTS,
+    })
+    tables['country'] = pd.DataFrame({
+        'Country': COUNTRIES,
+        'Country_Name': [f"Country {code}" for code in COUNTRIES],
+        'Population': rng.integers(1_000_000, 300_000_000, len(COUNTRIES)),
+        'Country_ID': np.arange(1, len(COUNTRIES) + 1),
+        'Continent_ID': rng.choice(tables['continent']['Continent_ID'], len(COUNTRIES)),
+        'Country_FormerName': None,
+    })
+    tables['geo_type'] = pd.DataFrame({
+        'Geo_Type_ID': np.arange(1, 7),
+        'Geo_Type_Name': ['Continent', 'Country', 'State', 'County', 'City', 'Street'],
+    })
+
+    state_ids = np.arange(1, len(COUNTRIES) * STATES_PER_COUNTRY + 1)
+    tables['state'] = pd.DataFrame({
+        'State_ID': state_ids,
+        'State_Type': 'State',
+        'State_Code': [f"S{i:03d}" for i in state_ids],
+        'State_Name': _names('State', state_ids),
+        'Country': np.repeat(COUNTRIES, STATES_PER_COUNTRY),
+    })
+    tables['county'] = pd.DataFrame({
+        'County_ID': state_ids + 1000,
+        'County_Name': _names('County', state_ids),
+        'County_Code': [f"C{i:03d}" for i in state_ids],
+        'County_Type': 'County',
+        'Country': np.repeat(COUNTRIES, STATES_PER_COUNTRY),
+        'Gov_State_ID': state_ids,
+    })
+
+    city_ids = np.arange(1, n['cities'] + 1)
+    tables['city'] = pd.DataFrame({
+        'City_ID': city_ids,
+        'City_Name': _names('City', city_ids),
+        'Country': rng.choice(COUNTRIES, n['cities']),
+    })
+
+    street_ids = np.arange(1_000_001, 1_000_001 + n['streets'])
+    street_city = rng.choice(city_ids, n['streets'])
+    postal_codes = [f"{code:05d}" for code in rng.integers(1000, 99999, n['streets'])]
+    tables['street_code'] = pd.DataFrame({
+        'Street_ID': street_ids,
+        'City_ID': street_city,
+        'Street_Name': _names('Street', street_ids),
+        'Postal_Code': postal_codes,
+        'Country': tables['city']['Country'].to_numpy()[street_city - 1],
+    })
+    tables['postal_code'] = pd.DataFrame({
+        'Street_ID': street_ids,
+        'Postal_Code': postal_codes,
+        'Country': tables['street_code']['Country'],
+    })
+
+    tables['customer_type'] = pd.DataFrame({
+        'Customer_Type_ID': [1010, 1020, 1030, 2010, 2020, 3010],
+        'Customer_Type': ['Orion Club members inactive', 'Orion Club members low activity',
+                          'Orion Club members medium activity', 'Orion Club Gold members low activity',
+                          'Orion Club Gold members medium activity', 'Internet/Catalog Customers'],
+        'Customer_Group_ID': [10, 10, 10, 20, 20, 30],
+        'Customer_Group': ['Orion Club members'] * 3 + ['Orion Club Gold members'] * 2 + ['Internet/Catalog Customers'],
+    })
+
+    customer_ids = np.arange(1, n['customers'] + 1)
+    customer_streets = rng.choice(street_ids, n['customers'])
+    tables['customer'] = pd.DataFrame({
+        'Customer_ID': customer_ids,
+        'Country': tables['street_code'].set_index('Street_ID').loc[customer_streets, 'Country'].to_numpy(),
+        'Gender': rng.choice(['F', 'M'], n['customers']),
+        'Personal_ID': None,
+        'Customer_Name': _names('Customer', customer_ids),
+        'Customer_FirstName': _names('First', customer_ids),
+        'Customer_LastName': _names('Last', customer_ids),
+        'Birth_Date': _dates(rng, '1940-01-01', 60 * 365, n['customers']),
+        'Customer_Address': _names('Address', customer_ids),
+        'Street_ID': customer_streets,
+        'Street_Number': rng.integers(1, 500, n['customers']),
+        'Customer_Type_ID': rng.choice(tables['customer_type']['Customer_Type_ID'], n['customers']),
+    })
+
+    tables['org_level'] = pd.DataFrame({
+        'Org_Level': [1, 2, 3, 4],
+        'Org_Level_Name': ['Employee', 'Section', 'Department', 'Company'],
+    })
+    employee_ids = np.arange(120101, 120101 + n['employees'])
+    tables['organization'] = pd.DataFrame({
+        'Employee_ID': employee_ids,
+        'Org_Name': _names('Employee', employee_ids),
+        'Org_Level': 1,
+        'Country': rng.choice(COUNTRIES, n['employees']),
+        'Company': rng.choice(['Orion Australia', 'Orion Belgium', 'Orion USA'], n['employees']),
+        'Department': rng.choice(['Sales', 'Administration', 'Engineering', 'Marketing'], n['employees']),
+        'Section': rng.choice(['Sales', 'Finance', 'IS', 'Logistics'], n['employees']),
+        'Org_Group': rng.choice(['Orion Shops', 'Orion Online', 'Orion Direct'], n['employees']),
+        'Job_Title': rng.choice(['Sales Rep. I', 'Sales Rep. II', 'Manager', 'Clerk'], n['employees']),
+        'Employee_Name': _names('Employee', employee_ids),
+        'Gender': rng.choice(['F', 'M'], n['employees']),
+        'Salary': rng.integers(25_000, 250_000, n['employees']),
+        'Birth_Date': _dates(rng, '1950-01-01', 40 * 365, n['employees']),
+        'Hire_Date': _dates(rng, '1990-01-01', 20 * 365, n['employees']),
+        'Term_Date': None,
+    })
+
+    supplier_ids = np.arange(1, n['suppliers'] + 1)
+    tables['supplier'] = pd.DataFrame({
+        'Supplier_ID': supplier_ids,
+        'Supplier_Name': _names('Supplier', supplier_ids),
+        'Street_ID': rng.choice(street_ids, n['suppliers']),
+        'Supplier_Address': _names('Address', supplier_ids),
+        'Sup_Street_Number': rng.integers(1, 500, n['suppliers']),
+        'Country': rng.choice(COUNTRIES, n['suppliers']),
+    })
+
+    tables['product_level'] = pd.DataFrame({
+        'Product_Level': [1, 2, 3, 4],
+        'Product_Level_Name': ['Product', 'Product Group', 'Product Category', 'Product Line'],
+    })
+    product_ids = np.arange(210200100001, 210200100001 + n['products'])
+    tables['product_list'] = pd.DataFrame({
+        'Product_ID': product_ids,
+        'Product_Name': _names('Product', product_ids),
+        'Supplier_ID': rng.choice(supplier_ids, n['products']),
+        'Product_Level': 1,
+        'Product_Ref_ID': product_ids // 100000,
+    })
+    unit_cost = np.round(rng.uniform(1, 200, n['products']), 2)
+    tables['price_list'] = pd.DataFrame({
+        'Product_ID': product_ids,
+        'Start_Date': pd.Timestamp('2003-01-01'),
+        'End_Date': pd.Timestamp('2012-12-31'),
+        'Unit_Cost_Price': unit_cost,
+        'Unit_Sales_Price': np.round(unit_cost * 2.1, 2),
+        'Factor': 1.0,
+    })
+    discounted = rng.choice(product_ids, max(1, n['products'] // 20), replace=False)
+    tables['discount'] = pd.DataFrame({
+        'Product_ID': discounted,
+        'Start_Date': _dates(rng, '2003-01-01', 9 * 365, len(discounted)),
+        'End_Date': pd.Timestamp('2012-12-31'),
+        'Unit_Sales_Price': np.round(rng.uniform(1, 400, len(discounted)), 2),
+        'Discount': rng.choice([0.3, 0.4, 0.5, 0.6], len(discounted)),
+    })
+
+    order_ids = np.arange(1230000001, 1230000001 + n['orders'])
+    order_dates = _dates(rng, '2003-01-01', 9 * 365, n['orders'])
+    tables['orders'] = pd.DataFrame({
+        'Order_ID': order_ids,
+        'Order_Type': rng.choice([1, 2, 3], n['orders']),
+        'Employee_ID': rng.choice(employee_ids, n['orders']),
+        'Customer_ID': rng.choice(customer_ids, n['orders']),
+        'Order_Date': order_dates,
+        'Delivery_Date': order_dates + pd.to_timedelta(rng.integers(0, 10, n['orders']), unit='D'),
+    })
+
+    # Spread exactly order_items rows over the orders, at least one item per order
+    items_per_order = np.ones(n['orders'], dtype=np.int64)
+    extra = max(0, order_items - n['orders'])
+    if extra:
+        np.add.at(items_per_order, rng.integers(0, n['orders'], extra), 1)
+    item_orders = np.repeat(order_ids, items_per_order)
+    starts = np.repeat(np.cumsum(items_per_order) - items_per_order, items_per_order)
+    item_products = rng.integers(0, n['products'], len(item_orders))
+    quantity = rng.integers(1, 6, len(item_orders))
+    cost = unit_cost[item_products]
+    tables['order_item'] = pd.DataFrame({
+        'Order_ID': item_orders,
+        'Order_Item_Num': np.arange(len(item_orders)) - starts + 1,
+        'Product_ID': product_ids[item_products],
+        'Quantity': quantity,
+        'Total_Retail_Price': np.round(cost * 2.1 * quantity, 2),
+        'CostPrice_Per_Unit': cost,
+        'Discount': np.where(rng.random(len(item_orders)) < 0.05, 0.3, np.nan),
+    })
+
+    return tables
@@ -0,0 +1,5 @@
+"""Shared helpers for the bi-transform-completed DAG.
+
+Airflow puts the dags folder on ``sys.path``, so the DAG imports these modules
+as ``bi_etl.<module>``.
+"""
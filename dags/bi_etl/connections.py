@@ -0,0 +1,31 @@
+"""SQLAlchemy engines shared within a task and its threads.
+
+Building an engine per call opens a fresh connection pool every time. Engines
+are cached per connection id instead, so the helpers of one task, and the
+threads it starts (such as the parallel COPY workers of a load), reuse one
+pool. The cache does not outlive the task: under the CeleryExecutor every task
+instance runs in its own process. Concurrent connections across tasks are
+limited by the Airflow pools (``mysql_source`` and ``postgres_warehouse``),
+not here. ``pool_pre_ping`` drops connections that went stale while a task
+was busy elsewhere. Every statement they execute is counted by
+:mod:`bi_etl.metrics`.
+"""
+from functools import lru_cache
+
+from airflow.providers.mysql.hooks.mysql import MySqlHook
+from airflow.providers.postgres.hooks.postgres import PostgresHook
+from sqlalchemy import create_engine
+
+from bi_etl.metrics import instrument
+
+
+@lru_cache(maxsize=None)
+def mysql_engine(conn_id):
+    """Return the pooled engine for a MySQL connection id."""
+    return instrument(MySqlHook(mysql_conn_id=conn_id).get_sqlalchemy_engine(engine_kwargs={"pool_pre_ping": True}))
+
+
+@lru_cache(maxsize=None)
+def postgres_engine(conn_id):
+    """Return the pooled engine for a PostgreSQL connection id."""
+    return instrument(create_engine(PostgresHook(postgres_conn_id=conn_id).get_uri(), pool_pre_ping=True))
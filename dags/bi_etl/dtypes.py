@@ -0,0 +1,230 @@
+"""Compact pandas dtypes for extracted tables.
+
+``pd.read_sql`` and ``pd.read_csv`` infer types chunk by chunk. Repeated strings
+stay object columns, and integer IDs turn into float64 in any chunk that
+holds a NULL. A dtype plan fixes one dtype per column:
+
+* ``category`` for low-cardinality strings (countries, genders, job titles);
+* nullable ``Int8`` .. ``Int64`` for integers, including IDs with NULLs;
+* ``datetime64[ns]`` for date columns returned as Python dates or ISO strings.
+
+Plans are declared in :data:`DECLARED_DTYPES` for the main source tables and
+inferred from the first chunk for every other column. Inferred plans are
+cached per table and reused while the table's columns stay the same.
+A chunk that does not fit its plan widens the column for that chunk and
+the following ones (e.g. ``Int16`` -> ``Int64``, ``Int64`` -> ``float64``) rather than
+failing.
+"""
+import json
+import logging
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+DECLARED_DTYPES = {
+    'orders': {
+        'Order_ID': 'Int64', 'Customer_ID': 'Int64', 'Employee_ID': 'Int64', 'Order_Type': 'Int8',
+        'Order_Date': 'datetime64[ns]', 'Delivery_Date': 'datetime64[ns]',
+    },
+    'order_item': {
+        'Order_ID': 'Int64', 'Order_Item_Num': 'Int16', 'Product_ID': 'Int64', 'Quantity': 'Int16',
+    },
+    'customer': {
+        'Customer_ID': 'Int64', 'Country': 'category', 'Gender': 'category', 'Street_ID': 'Int64',
+        'Customer_Type_ID': 'Int16', 'Birth_Date': 'datetime64[ns]',
+    },
+    'organization': {
+        'Employee_ID': 'Int64', 'Country': 'category', 'Company': 'category', 'Department': 'category',
+        'Section': 'category', 'Org_Group': 'category', 'Job_Title': 'category', 'Gender': 'category',
+    },
+    'product_list': {
+        'Product_ID': 'Int64', 'Supplier_ID': 'Int32', 'Product_Level': 'Int8', 'Product_Ref_ID': 'Int64',
+    },
+    'street_code': {
+        'Street_ID': 'Int64', 'City_ID': 'Int32', 'Country': 'category',
+    },
+}
+
+# String columns become categories when they have at most this many distinct
+# values and at most this share of distinct values in the first chunk
+CATEGORY_MAX = 1000
+CATEGORY_RATIO = 0.5
+
+NULLABLE_INTS = ['Int8', 'Int16', 'Int32', 'Int64']
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?$")
+
+
+def smallest_int(values):
+    """Return the smallest nullable integer dtype holding every value of ``values``."""
+    if values.empty:
+        return 'Int64'
+    low, high = values.min(), values.max()
+    for dtype in NULLABLE_INTS:
+        info = np.iinfo(dtype.lower())
+        if info.min <= low and high <= info.max:
+            return dtype
+    return None
+
+
+def infer_column_dtype(series, parse_dates=True):
+    """Infer the planned dtype of one column from a sample, or None to keep pandas' choice."""
+    values = series.dropna()
+    if values.empty or pd.api.types.is_bool_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+        return None
+    if pd.api.types.is_integer_dtype(series):
+        return smallest_int(values)
+    if pd.api.types.is_float_dtype(series):
+        return smallest_int(values) if (values % 1 == 0).all() else None
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return None
+
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind in ("date", "datetime"):
+        return 'datetime64[ns]' if parse_dates else None
+    if kind != "string":
+        return None
+    if parse_dates and values.map(lambda value: bool(ISO_DATE.match(value))).all():
+        return 'datetime64[ns]'
+    distinct = values.nunique()
+    if distinct <= CATEGORY_MAX and distinct <= CATEGORY_RATIO * len(values):
+        return 'category'
+    return None
+
+
+def infer_dtype_plan(df, parse_dates=True):
+    """Infer ``{column: dtype}`` for the columns of ``df`` that have a more compact dtype."""
+    plan = {}
+    for col in df.columns:
+        dtype = infer_column_dtype(df[col], parse_dates)
+        if dtype is not None:
+            plan[col] = dtype
+    return plan
+
+
+def convert_column(series, dtype):
+    """Convert ``series`` to ``dtype``, widening it if the values do not fit.
+
+    Returns the converted series and the dtype actually used.
+    """
+    if dtype == 'category':
+        return series.astype('category'), dtype
+    if dtype == 'datetime64[ns]':
+        return pd.to_datetime(series).astype(dtype), dtype
+    if dtype in NULLABLE_INTS:
+        numbers = pd.to_numeric(series)
+        values = numbers.dropna()
+        if not (values % 1 == 0).all():
+            return numbers.astype('float64'), 'float64'
+        fitting = smallest_int(values)
+        if fitting is None:
+            return numbers.astype('float64'), 'float64'
+        if NULLABLE_INTS.index(fitting) > NULLABLE_INTS.index(dtype):
+            dtype = fitting
+        return numbers.astype(dtype), dtype
+    return series.astype(dtype), dtype
+
+
+def whole_floats_to_int(series):
+    """``series`` as nullable ``Int64`` if it is a float column holding only whole numbers.
+
+    pandas stores an integer column holding NULLs as float64, so its values would be
+    written out as ``1.0``. Other series are returned unchanged.
+    """
+    if pd.api.types.is_float_dtype(series) and (series.dropna() % 1 == 0).all():
+        return series.astype('Int64')
+    return series
+
+
+def plan_path(cache_dir, table):
+    return os.path.join(cache_dir, f"{table}.dtypes.json")
+
+
+class DtypePlanner:
+    """Apply a table's dtype plan to a stream of chunks and measure the memory it saves.
+
+    ``cache_dir`` enables the cache of inferred plans. With ``parse_dates``
+    False, string and date columns are never planned as datetimes.
+    """
+
+    def __init__(self, table, cache_dir=None, parse_dates=True):
+        self.table = table
+        self.cache_dir = cache_dir
+        self.parse_dates = parse_dates
+        self.plan = None
+        self.memory_before = 0
+        self.memory_after = 0
+
+    def load_cached(self, columns):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(plan_path(self.cache_dir, self.table)) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cached["plan"] if cached.get("columns") == columns else None
+
+    def save_cached(self, columns):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = plan_path(self.cache_dir, self.table)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"columns": columns, "plan": self.plan}, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def make_plan(self, first_chunk):
+        columns = list(first_chunk.columns)
+        cached = self.load_cached(columns)
+        if cached is not None:
+            return cached, False
+        plan = infer_dtype_plan(first_chunk, self.parse_dates)
+        declared = DECLARED_DTYPES.get(self.table, {})
+        plan.update({
+            col: dtype for col, dtype in declared.items()
+            if col in first_chunk.columns and (self.parse_dates or dtype != 'datetime64[ns]')
+        })
+        return plan, True
+
+    def apply_to(self, chunk):
+        """Convert one chunk, widening the plan of any column that does not fit."""
+        converted = {}
+        for col, dtype in list(self.plan.items()):
+            if col not in chunk.columns:
+                continue
+            try:
+                converted[col], used = convert_column(chunk[col], dtype)
+            except (ValueError, TypeError) as e:
+                logging.warning(f"{self.table}.{col}: cannot convert to {dtype} ({e}); keeping {chunk[col].dtype}")
+                used = None
+            if used != dtype:
+                self.changed = True
+                if used is None:
+                    del self.plan[col]
+                else:
+                    self.plan[col] = used
+        return chunk.assign(**converted)
+
+    def apply(self, chunks):
+        """Yield ``chunks`` converted with the plan; the plan is made from the first chunk."""
+        self.changed = False
+        columns = None
+        for chunk in chunks:
+            if self.plan is None:
+                columns = list(chunk.columns)
+                self.plan, self.changed = self.make_plan(chunk)
+            self.memory_before += int(chunk.memory_usage(index=False, deep=True).sum())
+            chunk = self.apply_to(chunk)
+            self.memory_after += int(chunk.memory_usage(index=False, deep=True).sum())
+            yield chunk
+        if columns is not None and self.changed:
+            self.save_cached(columns)
+
+    def report(self):
+        """Log and return the in-memory size of the chunks before and after the plan."""
+        saved = 1 - self.memory_after / self.memory_before if self.memory_before else 0.0
+        logging.info(f"{self.table}: {self.memory_before / 1e6:.2f} MB -> {self.memory_after / 1e6:.2f} MB "
+                     f"in memory with the dtype plan ({saved:.0%} saved)")
+        return {"before_bytes": self.memory_before, "after_bytes": self.memory_after}
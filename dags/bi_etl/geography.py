@@ -0,0 +1,153 @@
+"""Indexed lookups resolving streets to Geography_Dim rows.
+
+Streets are resolved against two lookups, each a DataFrame indexed on a
+unique key:
+
+* countries by country code, with the country's ID and continent;
+* cities by ``City_ID``, with the city name and country code.
+
+Each street takes one hash lookup per level, so the output has exactly one
+row per street. The source has no key linking a street or a city to a state
+(``county.Gov_State_ID`` is not referenced by cities or streets), so
+Geography_Dim has no state columns; the ones written by earlier versions,
+NULL in every country with several states, are dropped by
+:func:`drop_state_columns`.
+
+The lookups are saved under the staging directory together with the
+fingerprints of the source tables they were built from, and reused by later
+runs while those fingerprints match.
+"""
+import json
+import logging
+import os
+
+import pandas as pd
+from pyarrow import feather
+from sqlalchemy import inspect, text
+
+from bi_etl.load import quote
+
+LOOKUPS = ("countries", "cities")
+
+# State columns of Geography_Dim written by earlier versions
+STATE_COLUMNS = ['State_ID', 'State_Code', 'State']
+
+
+def unique_index(df, key, name):
+    """Index ``df`` on ``key``, raising ValueError if a key value occurs twice."""
+    duplicated = df[key][df[key].duplicated()]
+    if not duplicated.empty:
+        raise ValueError(f"{name} has duplicate {key} values: {sorted(duplicated.unique().tolist())[:10]}")
+    return df.set_index(key)
+
+
+def lookups_fingerprint(*handles):
+    """Combined fingerprint of the staged inputs, or None if one of them has none."""
+    fingerprints = [handle.get("fingerprint") for handle in handles]
+    if None in fingerprints:
+        return None
+    return "|".join(str(fingerprint) for fingerprint in fingerprints)
+
+
+def lookup(table, keys):
+    """Rows of the indexed ``table`` for each of ``keys``, NaN where a key is missing."""
+    return table.reindex(pd.Index(keys.astype(object)))
+
+
+class GeographyLookups:
+    """Country and city lookups for resolving streets."""
+
+    def __init__(self, countries, cities):
+        self.countries = countries
+        self.cities = cities
+
+    @classmethod
+    def build(cls, city_df, continent_df, country_df):
+        continents = unique_index(continent_df, 'Continent_ID', 'continent')['Continent_Name']
+        countries = unique_index(country_df, 'Country', 'country')
+        countries = pd.DataFrame({
+            'Country_ID': countries['Country_ID'],
+            'Continent': lookup(continents, countries['Continent_ID']).to_numpy(),
+        }, index=countries.index.astype(object))
+
+        cities = unique_index(city_df, 'City_ID', 'city').rename(columns={'City_Name': 'City', 'Country': 'City_Country'})
+        cities = cities[['City', 'City_Country']]
+        logging.warning("The source links no street or city to a state; Geography_Dim has no state columns")
+        return cls(countries, cities)
+
+    @classmethod
+    def load(cls, directory, fingerprint):
+        """Return the lookups saved in ``directory`` if they were built from ``fingerprint``, else None."""
+        if fingerprint is None:
+            return None
+        try:
+            with open(os.path.join(directory, "lookups.json")) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get("fingerprint") != fingerprint:
+            return None
+        frames = {}
+        for name in LOOKUPS:
+            df = feather.read_table(os.path.join(directory, f"{name}.arrow")).to_pandas()
+            frames[name] = df.set_index(saved["keys"][name])
+        logging.info(f"Reusing the geography lookups in {directory}")
+        return cls(**frames)
+
+    def save(self, directory, fingerprint):
+        """Save the lookups to ``directory``; nothing is saved without a fingerprint to check them against."""
+        if fingerprint is None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        keys = {}
+        for name in LOOKUPS:
+            df = getattr(self, name)
+            keys[name] = df.index.name
+            path = os.path.join(directory, f"{name}.arrow")
+            feather.write_feather(df.reset_index(), f"{path}.tmp", compression="uncompressed")
+            os.replace(f"{path}.tmp", path)
+        # Written last, so the lookups only count as saved once every file is in place
+        path = os.path.join(directory, "lookups.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"fingerprint": fingerprint, "keys": keys}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def resolve(self, street_code_df):
+        """Resolve every street to its city, country and continent; one row per street."""
+        streets = unique_index(street_code_df, 'Street_ID', 'street_code')
+        country = lookup(self.countries, streets['Country'])
+        city = lookup(self.cities, streets['City_ID'])
+
+        geo_dim_df = pd.DataFrame({
+            'Street_ID': streets.index.to_numpy(),
+            'Continent': country['Continent'].to_numpy(),
+            'Country': streets['Country'].astype(object).to_numpy(),
+            'Postal_Code': streets['Postal_Code'].to_numpy(),
+            'City': city['City'].to_numpy(),
+            'Street_Name': streets['Street_Name'].to_numpy(),
+        })
+        if len(geo_dim_df) != len(street_code_df):
+            raise ValueError(f"Geography_Dim has {len(geo_dim_df)} rows for {len(street_code_df)} streets")
+
+        problems = {
+            'have an unknown country code': country['Country_ID'].isna().to_numpy(),
+            'have an unknown City_ID': city['City'].isna().to_numpy(),
+            'are in a city of another country': city['City_Country'].notna().to_numpy()
+                & (city['City_Country'].astype(object).to_numpy() != streets['Country'].astype(object).to_numpy()),
+        }
+        for problem, mask in problems.items():
+            if mask.any():
+                logging.warning(f"Geography_Dim: {int(mask.sum())} of {len(streets)} streets {problem}")
+        return geo_dim_df
+
+
+def drop_state_columns(engine):
+    """Drop the state columns that earlier versions wrote to Geography_Dim, if it has any."""
+    with engine.begin() as conn:
+        if not inspect(conn).has_table('Geography_Dim'):
+            return
+        existing = {col["name"] for col in inspect(conn).get_columns('Geography_Dim')}
+        for column in STATE_COLUMNS:
+            if column in existing:
+                logging.warning(f"Geography_Dim: dropping column {column}")
+                conn.execute(text(f"ALTER TABLE {quote('Geography_Dim')} DROP COLUMN {quote(column)}"))
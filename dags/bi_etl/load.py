@@ -0,0 +1,235 @@
+"""Bulk and merge loading into the PostgreSQL warehouse.
+
+DataFrames are streamed into PostgreSQL with ``COPY ... FROM STDIN`` in CSV
+batches, optionally from several connections at once. Merge loads COPY rows
+into an unlogged staging table and merge them into the target with
+``INSERT ... ON CONFLICT DO UPDATE`` on the table's natural key. Targets are
+created once and kept between runs together with their unique key index, and
+rows whose values did not change are not rewritten.
+"""
+import io
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from sqlalchemy import inspect, text
+
+from bi_etl.dtypes import whole_floats_to_int
+from bi_etl.metrics import increment
+
+# Rows per COPY statement
+BATCH_SIZE = 50000
+
+
+def quote(name):
+    """Quote a PostgreSQL identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def sql_type(series):
+    """Return the PostgreSQL column type for a pandas Series."""
+    if pd.api.types.is_bool_dtype(series):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(series):
+        return "BIGINT"
+    if pd.api.types.is_float_dtype(series):
+        return "DOUBLE PRECISION"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "TIMESTAMP"
+    # MySQL DECIMAL columns are read back as objects holding Decimal values
+    if pd.api.types.is_object_dtype(series) and pd.api.types.infer_dtype(series, skipna=True) == "decimal":
+        return "NUMERIC"
+    return "TEXT"
+
+
+def column_type(df, col, types=None):
+    """Return the PostgreSQL type of column ``col`` of ``df``, from ``types`` if it is listed there."""
+    return (types or {}).get(col) or sql_type(df[col])
+
+
+def drop_duplicate_keys(conn, table, keys):
+    """Delete all but one row per natural key of a table written before it was indexed on ``keys``.
+
+    Nothing is done once the table's unique key index exists. The rows kept are
+    rewritten by the next merge load. Returns the number of rows deleted.
+    """
+    if any(index["name"] == f"{table}_nk" for index in inspect(conn).get_indexes(table)):
+        return 0
+    matches = " AND ".join(f"d.{quote(key)} = k.{quote(key)}" for key in keys)
+    deleted = conn.execute(text(
+        f"DELETE FROM {quote(table)} d USING {quote(table)} k WHERE {matches} AND d.ctid > k.ctid"
+    )).rowcount
+    if deleted:
+        logging.warning(f"{table}: deleted {deleted} rows duplicating a {keys} value, left from an older grain")
+    return deleted
+
+
+def ensure_table(conn, df, table, keys, types=None):
+    """Create ``table`` from the columns of ``df`` if needed and index its natural key.
+
+    ``types`` maps columns to a PostgreSQL type that overrides :func:`sql_type`.
+
+    Columns added to ``df`` since the table was created are added to the
+    table. A table that lacks a key column predates merge loading, and one
+    indexed on other keys was written at another grain; both are rebuilt once.
+    One without a key index is deduplicated on the key before it is indexed.
+    """
+    inspector = inspect(conn)
+    if inspector.has_table(table):
+        existing = {col["name"] for col in inspector.get_columns(table)}
+        index = next((index for index in inspector.get_indexes(table) if index["name"] == f"{table}_nk"), None)
+        if not set(keys) <= existing:
+            logging.warning(f"{table} has no natural key {keys}; rebuilding it for merge loading. "
+                            "Run incremental sources with full_refresh to reload its history.")
+            conn.execute(text(f"DROP TABLE {quote(table)}"))
+            existing = None
+        elif index is not None and index["column_names"] != list(keys):
+            logging.warning(f"{table} is keyed on {index['column_names']}, not {keys}; rebuilding it")
+            conn.execute(text(f"DROP TABLE {quote(table)}"))
+            existing = None
+        elif index is None:
+            drop_duplicate_keys(conn, table, keys)
+    else:
+        existing = None
+
+    if existing is None:
+        # Types come from sql_type rather than the frame's exact dtypes, so that a compact
+        # dtype (Int16, category) in one run does not narrow the column for later runs
+        column_defs = ", ".join(f"{quote(col)} {column_type(df, col, types)}" for col in df.columns)
+        conn.execute(text(f"CREATE TABLE {quote(table)} ({column_defs})"))
+    else:
+        for col in df.columns:
+            if col not in existing:
+                logging.info(f"Adding column {col} to {table}")
+                conn.execute(text(f"ALTER TABLE {quote(table)} ADD COLUMN {quote(col)} {column_type(df, col, types)}"))
+
+    key_list = ", ".join(quote(key) for key in keys)
+    conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {quote(table + '_nk')} ON {quote(table)} ({key_list})"))
+
+
+def copy_frame(cursor, df, table, batch_size=BATCH_SIZE):
+    """COPY ``df`` into ``table`` on a psycopg2 cursor, ``batch_size`` rows per statement."""
+    df = df.copy()
+    for col in df.columns:
+        # COPY into an integer column rejects the "1.0" that a float column writes to CSV, and
+        # frames built by merges or reindexing turn integer IDs into floats when a row has none
+        df[col] = whole_floats_to_int(df[col])
+
+    column_list = ", ".join(quote(col) for col in df.columns)
+    sql = f"COPY {quote(table)} ({column_list}) FROM STDIN WITH (FORMAT csv)"
+    for start in range(0, len(df), batch_size):
+        buffer = io.StringIO()
+        df.iloc[start:start + batch_size].to_csv(buffer, index=False, header=False)
+        increment("bytes", buffer.tell())
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+        increment("round_trips")
+
+
+def copy_load(engine, df, table, batch_size=BATCH_SIZE, workers=1, partition_by=None):
+    """COPY ``df`` into an existing ``table`` and report the throughput.
+
+    With ``workers`` > 1 the rows are split into parts that are copied in
+    parallel, each on its own connection and transaction. ``partition_by``
+    (a column name or Series) groups the rows so that each part maps to one
+    partition of a partitioned table; otherwise the frame is cut into
+    ``workers`` contiguous slices.
+    """
+    start_time = time.monotonic()
+    if workers > 1 and partition_by is not None:
+        parts = [part for _, part in df.groupby(partition_by, sort=False, observed=True)]
+    elif workers > 1:
+        size = -(-len(df) // workers)
+        parts = [df.iloc[start:start + size] for start in range(0, len(df), size)]
+    else:
+        parts = [df]
+
+    def copy_part(part):
+        conn = engine.raw_connection()
+        try:
+            with conn.cursor() as cursor:
+                copy_frame(cursor, part, table, batch_size)
+            conn.commit()
+        finally:
+            conn.close()
+
+    if len(parts) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(copy_part, parts))
+    elif parts and not parts[0].empty:
+        copy_part(parts[0])
+
+    elapsed = time.monotonic() - start_time
+    rate = len(df) / elapsed if elapsed > 0 else 0
+    logging.info(f"{table}: copied {len(df)} rows in {elapsed:.2f}s ({rate:,.0f} rows/s, {len(parts)} part(s))")
+    return len(df)
+
+
+def merge_load(engine, df, table, keys, batch_size=BATCH_SIZE, workers=1, partition_by=None, types=None):
+    """Upsert ``df`` into ``table`` keyed on ``keys``. Returns the number of rows written.
+
+    Rows are bulk-loaded with :func:`copy_load` into an unlogged staging table
+    first, so ``batch_size``, ``workers`` and ``partition_by`` apply to that
+    step. ``types`` overrides the column types of a new table, as in :func:`ensure_table`.
+    """
+    df = df.drop_duplicates(subset=keys, keep="last")
+    return merge_load_chunks(engine, [df], table, keys, batch_size=batch_size, workers=workers, partition_by=partition_by,
+                             types=types)
+
+
+def merge_load_chunks(engine, chunks, table, keys, batch_size=BATCH_SIZE, workers=1, partition_by=None, types=None):
+    """Upsert an iterable of DataFrames into ``table`` with a single merge.
+
+    Each chunk is copied into the staging table as it arrives, so only one
+    chunk is held in memory. If a key occurs more than once across chunks,
+    one of its rows is kept.
+    """
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        return 0
+
+    stage = f"{table}__stage"
+    columns = list(first.columns)
+    column_list = ", ".join(quote(col) for col in columns)
+    key_list = ", ".join(quote(key) for key in keys)
+    updates = [col for col in columns if col not in keys]
+
+    if updates:
+        target_values = ", ".join(f"{quote(table)}.{quote(col)}" for col in updates)
+        new_values = ", ".join(f"EXCLUDED.{quote(col)}" for col in updates)
+        conflict_action = (
+            "DO UPDATE SET " + ", ".join(f"{quote(col)} = EXCLUDED.{quote(col)}" for col in updates)
+            + f" WHERE ({target_values}) IS DISTINCT FROM ({new_values})"
+        )
+    else:
+        conflict_action = "DO NOTHING"
+
+    with engine.begin() as conn:
+        ensure_table(conn, first, table, keys, types)
+        conn.execute(text(f"DROP TABLE IF EXISTS {quote(stage)}"))
+        conn.execute(text(
+            f"CREATE UNLOGGED TABLE {quote(stage)} AS "
+            f"SELECT {column_list} FROM {quote(table)} WITH NO DATA"
+        ))
+
+    try:
+        rows = 0
+        for chunk in itertools.chain([first], chunks):
+            rows += copy_load(engine, chunk, stage, batch_size=batch_size, workers=workers, partition_by=partition_by)
+        start_time = time.monotonic()
+        with engine.begin() as conn:
+            result = conn.execute(text(
+                f"INSERT INTO {quote(table)} ({column_list}) "
+                f"SELECT DISTINCT ON ({key_list}) {column_list} FROM {quote(stage)} "
+                f"ON CONFLICT ({key_list}) {conflict_action}"
+            ))
+        elapsed = time.monotonic() - start_time
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {quote(stage)}"))
+
+    logging.info(f"{table}: merged {rows} rows in {elapsed:.2f}s, {result.rowcount} inserted or updated")
+    return result.rowcount
@@ -0,0 +1,245 @@
+"""Per-stage metrics for the DAG tasks and the import/export scripts.
+
+Wrap a unit of work in :func:`stage` to record its wall time, rows in and out,
+bytes serialized, peak RSS and database round-trips::
+
+    with stage("load.Customer_Dim", run_id=run_id, summary_engine=engine) as metrics:
+        metrics.rows_in = len(df)
+        metrics.rows_out = merge_load(engine, df, 'Customer_Dim', keys)
+
+Bytes and round-trips are process-wide counters fed by :func:`increment`
+(staging writes, COPY batches) and by :func:`instrument`, which counts every
+statement executed through a SQLAlchemy engine. A stage reports how much each
+counter grew while it ran. RSS is sampled from ``/proc/self/statm`` by a
+background thread while the stage runs; a stage reports the highest RSS seen
+and how far that is above the RSS it started with. Where ``/proc`` is not
+available, the process-lifetime peak from ``getrusage`` is reported instead.
+
+When ``STATSD_HOST`` is set, each stage is sent over UDP as StatsD timers,
+counters and gauges (``<prefix>.<stage>.duration`` etc.), which a
+statsd_exporter turns into OpenMetrics series. With a ``summary_engine`` the
+stage is also stored as a row of the ``etl_run_summary`` table.
+"""
+import logging
+import os
+import re
+import resource
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import event, inspect, text
+
+STATSD_HOST = os.environ.get("STATSD_HOST")
+STATSD_PORT = int(os.environ.get("STATSD_PORT", "8125"))
+STATSD_PREFIX = os.environ.get("STATSD_PREFIX", "bi_etl")
+
+RUN_SUMMARY_TABLE = "etl_run_summary"
+
+# Interval between RSS samples while a stage runs
+RSS_SAMPLE_SECONDS = 0.05
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+_counters = {"bytes": 0, "round_trips": 0}
+_counters_lock = threading.Lock()
+_socket = None
+
+
+def increment(counter, value=1):
+    """Add ``value`` to a process-wide counter ('bytes' or 'round_trips')."""
+    with _counters_lock:
+        _counters[counter] += value
+
+
+def instrument(engine):
+    """Count every statement executed through ``engine`` as a round-trip."""
+    if not event.contains(engine, "before_cursor_execute", _count_statement):
+        event.listen(engine, "before_cursor_execute", _count_statement)
+    return engine
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    increment("round_trips")
+
+
+def process_peak_rss():
+    """Peak resident set size of this process since it started, in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # kilobytes on Linux
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class RssSampler:
+    """Samples the RSS of this process every ``interval`` seconds in a background thread."""
+
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.start_rss = current_rss()
+        self.peak = self.start_rss
+        self._stop = threading.Event()
+        self._thread = None
+        if self.start_rss is not None:
+            self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+            self._thread.start()
+
+    def _sample(self):
+        rss = current_rss()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def stop(self):
+        """Stop sampling and return the peak RSS and its growth over the start, in bytes."""
+        if self._thread is None:
+            return process_peak_rss(), None
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return self.peak, self.peak - self.start_rss
+
+
+class StageMetrics:
+    """Measurements of one stage; ``rows_in`` and ``rows_out`` are set by the caller."""
+
+    def __init__(self, name, run_id=None):
+        self.name = name
+        self.run_id = run_id
+        self.started_at = datetime.now(timezone.utc)
+        self.status = "running"
+        self.seconds = None
+        self.rows_in = None
+        self.rows_out = None
+        self.bytes = 0
+        self.round_trips = 0
+        self.peak_rss = None
+        self.peak_rss_growth = None
+
+    def as_dict(self):
+        return {
+            "run_id": self.run_id, "stage": self.name, "status": self.status,
+            "started_at": self.started_at, "seconds": self.seconds,
+            "rows_in": self.rows_in, "rows_out": self.rows_out, "bytes": self.bytes,
+            "round_trips": self.round_trips, "peak_rss_bytes": self.peak_rss,
+            "peak_rss_growth_bytes": self.peak_rss_growth,
+        }
+
+
+@contextmanager
+def stage(name, run_id=None, summary_engine=None):
+    """Measure the enclosed block as stage ``name`` and emit the result.
+
+    The metrics are emitted whether or not the block raises; a failed stage is
+    recorded with status 'failed' and the exception is re-raised.
+    """
+    metrics = StageMetrics(name, run_id)
+    with _counters_lock:
+        before = dict(_counters)
+    sampler = RssSampler()
+    start = time.perf_counter()
+    try:
+        yield metrics
+        metrics.status = "ok"
+    except BaseException:
+        metrics.status = "failed"
+        raise
+    finally:
+        metrics.seconds = time.perf_counter() - start
+        with _counters_lock:
+            metrics.bytes = _counters["bytes"] - before["bytes"]
+            metrics.round_trips = _counters["round_trips"] - before["round_trips"]
+        metrics.peak_rss, metrics.peak_rss_growth = sampler.stop()
+        growth = "" if metrics.peak_rss_growth is None else f" (+{metrics.peak_rss_growth / 1e6:.0f} MB)"
+        logging.info(
+            f"[{name}] {metrics.status} in {metrics.seconds:.2f}s, rows in/out {metrics.rows_in}/{metrics.rows_out}, "
+            f"{metrics.bytes / 1e6:.2f} MB, {metrics.round_trips} round-trips, peak RSS {metrics.peak_rss / 1e6:.0f} MB{growth}"
+        )
+        send_statsd(metrics)
+        if summary_engine is not None:
+            write_summary(summary_engine, metrics)
+
+
+def _metric_name(name):
+    return re.sub(r"[^A-Za-z0-9_.]", "_", f"{STATSD_PREFIX}.{name}")
+
+
+def send_statsd(metrics):
+    """Send a stage to the StatsD server in STATSD_HOST, if one is configured."""
+    global _socket
+    if not STATSD_HOST:
+        return
+    base = _metric_name(metrics.name)
+    lines = [
+        f"{base}.duration:{metrics.seconds * 1000:.3f}|ms",
+        f"{base}.bytes:{metrics.bytes}|c",
+        f"{base}.round_trips:{metrics.round_trips}|c",
+        f"{base}.peak_rss:{metrics.peak_rss}|g",
+        f"{base}.{metrics.status}:1|c",
+    ]
+    if metrics.peak_rss_growth is not None:
+        lines.append(f"{base}.peak_rss_growth:{metrics.peak_rss_growth}|g")
+    if metrics.rows_in is not None:
+        lines.append(f"{base}.rows_in:{metrics.rows_in}|c")
+    if metrics.rows_out is not None:
+        lines.append(f"{base}.rows_out:{metrics.rows_out}|c")
+    try:
+        if _socket is None:
+            _socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        _socket.sendto("\n".join(lines).encode(), (STATSD_HOST, STATSD_PORT))
+    except OSError as e:
+        logging.warning(f"Could not send metrics for {metrics.name} to StatsD: {e}")
+
+
+def write_summary(engine, metrics):
+    """Append a stage to the run-summary table. Failures are logged, not raised.
+
+    The table is created in PostgreSQL (DAG and export) or MySQL (Access import); MySQL
+    has no time zone aware type, so ``started_at`` is stored there as UTC.
+    """
+    postgres = engine.dialect.name == "postgresql"
+    row = metrics.as_dict()
+    if not postgres:
+        row["started_at"] = row["started_at"].replace(tzinfo=None)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {RUN_SUMMARY_TABLE} (
+                    run_id TEXT,
+                    stage TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    started_at {"TIMESTAMPTZ" if postgres else "DATETIME(6)"} NOT NULL,
+                    seconds DOUBLE PRECISION,
+                    rows_in BIGINT,
+                    rows_out BIGINT,
+                    bytes BIGINT,
+                    round_trips BIGINT,
+                    peak_rss_bytes BIGINT,
+                    peak_rss_growth_bytes BIGINT
+                )
+            """))
+            # Added after the first release of the table
+            if "peak_rss_growth_bytes" not in {col["name"] for col in inspect(conn).get_columns(RUN_SUMMARY_TABLE)}:
+                conn.execute(text(f"ALTER TABLE {RUN_SUMMARY_TABLE} ADD COLUMN peak_rss_growth_bytes BIGINT"))
+            conn.execute(text(f"""
+                INSERT INTO {RUN_SUMMARY_TABLE}
+                    (run_id, stage, status, started_at, seconds, rows_in, rows_out, bytes, round_trips,
+                     peak_rss_bytes, peak_rss_growth_bytes)
+                VALUES
+                    (:run_id, :stage, :status, :started_at, :seconds, :rows_in, :rows_out, :bytes, :round_trips,
+                     :peak_rss_bytes, :peak_rss_growth_bytes)
+            """), row)
+    except Exception as e:
+        logging.warning(f"Could not store metrics for {metrics.name} in {RUN_SUMMARY_TABLE}: {e}")
@@ -0,0 +1,94 @@
+"""Builders for Order_Fact.
+
+:func:`build_order_fact` merges the full staged frames in memory. The two
+streaming alternatives yield the fact rows in bounded chunks:
+
+* the SQL engine runs the joins as one statement on the MySQL source and reads
+  the result through a server-side cursor;
+* the chunked engine resolves ``order_item`` batches from the staging store
+  against the orders and customers they reference, read from the
+  memory-mapped staged files.
+"""
+import pandas as pd
+from sqlalchemy import text
+
+from bi_etl.staging import iter_staged, open_staged, read_staged, read_staged_rows
+
+ORDER_FACT_COLUMNS = [
+    'Customer_ID', 'Employee_ID', 'Street_ID', 'Product_ID', 'Order_Date', 'Order_ID', 'Order_Item_Num',
+    'Order_Type', 'Delivery_Date', 'Quantity', 'Total_Retail_Price', 'Costprice_Per_Unit', 'Discount',
+]
+
+ORDER_FACT_SQL = """
+SELECT c.Customer_ID, o.Employee_ID, c.Street_ID, oi.Product_ID, o.Order_Date, o.Order_ID,
+       oi.Order_Item_Num, o.Order_Type, o.Delivery_Date, oi.Quantity, oi.Total_Retail_Price,
+       oi.CostPrice_Per_Unit AS Costprice_Per_Unit, oi.Discount
+FROM orders o
+JOIN order_item oi ON oi.Order_ID = o.Order_ID
+JOIN customer c ON c.Customer_ID = o.Customer_ID
+JOIN organization e ON e.Employee_ID = o.Employee_ID
+JOIN product_list p ON p.Product_ID = oi.Product_ID
+JOIN street_code s ON s.Street_ID = c.Street_ID
+"""
+
+
+def build_order_fact(orders_df, order_item_df, customer_df, organization_df, product_df, street_code_df):
+    """Order_Fact from in-memory frames, one row per order item."""
+    order_fact_df = pd.merge(orders_df, order_item_df, on='Order_ID')
+    order_fact_df = pd.merge(order_fact_df, customer_df, on='Customer_ID')
+    order_fact_df = pd.merge(order_fact_df, organization_df, on='Employee_ID')
+    order_fact_df = pd.merge(order_fact_df, product_df, on='Product_ID')
+    # Street_ID comes from the customer merge; keep only streets known to street_code
+    order_fact_df = pd.merge(order_fact_df, street_code_df, on='Street_ID')
+    order_fact_df = order_fact_df.rename(columns={'CostPrice_Per_Unit': 'Costprice_Per_Unit'})
+    return order_fact_df[ORDER_FACT_COLUMNS]
+
+
+def order_fact_query(lower=None, upper=None):
+    """Return the Order_Fact statement and its parameters for an optional Order_ID range (lower, upper]."""
+    conditions = []
+    params = {}
+    if lower is not None:
+        conditions.append("o.Order_ID > :lower")
+        params["lower"] = lower
+    if upper is not None:
+        conditions.append("o.Order_ID <= :upper")
+        params["upper"] = upper
+    sql = ORDER_FACT_SQL
+    if conditions:
+        sql += "WHERE " + " AND ".join(conditions) + "\n"
+    return text(sql), params
+
+
+def stream_order_fact(mysql_engine, lower=None, upper=None, chunksize=50000):
+    """Yield Order_Fact rows from the MySQL source as DataFrames of ``chunksize`` rows."""
+    sql, params = order_fact_query(lower, upper)
+    with mysql_engine.connect().execution_options(stream_results=True) as conn:
+        yield from pd.read_sql(sql, conn, params=params, chunksize=chunksize)
+
+
+def chunked_order_fact(orders, order_item, customer, organization, product, street_code, chunksize=50000):
+    """Yield Order_Fact rows built from staged tables, ``chunksize`` order items at a time.
+
+    ``orders`` and ``customer`` stay memory-mapped: each chunk loads only the
+    orders it references, and the customers of those orders. The employee,
+    product and street tables are reduced to key sets used as inner join
+    filters. Peak memory is set by one chunk, its orders and customers, and
+    those key sets, so it does not grow with the number of orders.
+    """
+    orders_table = open_staged(orders, columns=['Order_ID', 'Customer_ID', 'Employee_ID', 'Order_Date', 'Order_Type', 'Delivery_Date'])
+    customer_table = open_staged(customer, columns=['Customer_ID', 'Street_ID'])
+    employee_ids = pd.Index(read_staged(organization, columns=['Employee_ID'])['Employee_ID'])
+    product_ids = pd.Index(read_staged(product, columns=['Product_ID'])['Product_ID'])
+    street_ids = pd.Index(read_staged(street_code, columns=['Street_ID'])['Street_ID'])
+
+    item_columns = ['Order_ID', 'Order_Item_Num', 'Product_ID', 'Quantity', 'Total_Retail_Price', 'CostPrice_Per_Unit', 'Discount']
+    for chunk in iter_staged(order_item, columns=item_columns, batch_size=chunksize):
+        chunk = chunk[chunk['Product_ID'].isin(product_ids)]
+        chunk = chunk.join(read_staged_rows(orders_table, 'Order_ID', chunk['Order_ID']), on='Order_ID', how='inner')
+        chunk = chunk[chunk['Employee_ID'].isin(employee_ids)]
+        chunk = chunk.join(read_staged_rows(customer_table, 'Customer_ID', chunk['Customer_ID']), on='Customer_ID', how='inner')
+        chunk = chunk[chunk['Street_ID'].isin(street_ids)]
+        chunk = chunk.rename(columns={'CostPrice_Per_Unit': 'Costprice_Per_Unit'})
+        if not chunk.empty:
+            yield chunk[ORDER_FACT_COLUMNS]
@@ -0,0 +1,239 @@
+"""Monthly range-partitioned warehouse tables loaded by partition swap.
+
+A partitioned table is created with ``PARTITION BY RANGE`` on a date column
+and holds one partition per calendar month, named ``<table>_pYYYY_MM``.
+Loads COPY the incoming rows into an unlogged staging table, then rebuild only
+the months that occur in it. Each month is built into a separate table from
+the incoming rows plus the existing partition's rows that they do not replace.
+The new table is then swapped in with ``DETACH``/``ATTACH PARTITION``, so
+readers only wait for the short swap. Queries filtering on the partition
+column are pruned to the months they touch.
+
+Rows are matched on the table's natural key within a month; the unique index
+of a partitioned table also includes the partition column, as PostgreSQL
+requires.
+"""
+import itertools
+import logging
+import time
+from datetime import timedelta
+
+import pandas as pd
+from sqlalchemy import inspect, text
+
+from bi_etl.load import BATCH_SIZE, column_type, copy_load, quote
+
+
+def partition_name(table, month):
+    """Return the name of the partition of ``table`` holding ``month``."""
+    return f"{table}_p{month:%Y_%m}"
+
+
+def next_month(month):
+    return (month.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def table_kind(conn, table):
+    """Return 'p' for a partitioned table, 'r' for a plain one, or None if ``table`` does not exist."""
+    return conn.execute(text(
+        "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = current_schema() AND c.relname = :table"
+    ), {"table": table}).scalar()
+
+
+def table_columns(conn, table):
+    return [col["name"] for col in inspect(conn).get_columns(table)]
+
+
+def ensure_partitioned_table(engine, df, table, keys, partition_column, types=None):
+    """Create ``table`` partitioned by month on ``partition_column`` and index its key.
+
+    ``types`` overrides the type of some columns, as in :func:`bi_etl.load.ensure_table`.
+
+    Columns added to ``df`` since the table was created are added to it (and
+    so to every partition). A plain table of the same name, as written before
+    partitioning, is converted once, in a single transaction: its rows are
+    moved into monthly partitions of the new table. One that lacks a key
+    column predates merge loading and cannot be deduplicated on the key; it
+    is rebuilt empty, as in :func:`bi_etl.load.ensure_table`.
+    """
+    with engine.begin() as conn:
+        kind = table_kind(conn, table)
+        legacy = None
+        if kind == "r":
+            legacy_columns = table_columns(conn, table)
+            if not {*keys, partition_column} <= set(legacy_columns):
+                logging.warning(f"{table} has no natural key {keys}; rebuilding it as a partitioned table. "
+                                "Run incremental sources with full_refresh to reload its history.")
+                conn.execute(text(f"DROP TABLE {quote(table)}"))
+                kind = None
+            else:
+                # Keep the old column types; only the partition column must be a timestamp
+                legacy = f"{table}__unpartitioned"
+                logging.warning(f"{table} is not partitioned; moving its rows into monthly partitions")
+                conn.execute(text(f"DROP TABLE IF EXISTS {quote(legacy)}"))
+                conn.execute(text(f"ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}"))
+                conn.execute(text(f"DROP INDEX IF EXISTS {quote(table + '_nk')}"))
+                conn.execute(text(
+                    f"ALTER TABLE {quote(legacy)} ALTER COLUMN {quote(partition_column)} "
+                    f"TYPE TIMESTAMP USING {quote(partition_column)}::timestamp"
+                ))
+                conn.execute(text(
+                    f"CREATE TABLE {quote(table)} (LIKE {quote(legacy)}) PARTITION BY RANGE ({quote(partition_column)})"
+                ))
+        if kind is None:
+            column_defs = ", ".join(f"{quote(col)} {column_type(df, col, types)}" for col in df.columns)
+            conn.execute(text(
+                f"CREATE TABLE {quote(table)} ({column_defs}) PARTITION BY RANGE ({quote(partition_column)})"
+            ))
+
+        existing = set(table_columns(conn, table))
+        for col in df.columns:
+            if col not in existing:
+                logging.info(f"Adding column {col} to {table}")
+                conn.execute(text(f"ALTER TABLE {quote(table)} ADD COLUMN {quote(col)} {column_type(df, col, types)}"))
+
+        if legacy is not None:
+            # Same transaction as the rename: a failure leaves the old table in place
+            for month in partition_months(conn, table, legacy, partition_column):
+                build_partition(conn, table, legacy, legacy_columns, keys, partition_column, month)
+                swap_partition(conn, table, partition_column, month)
+            conn.execute(text(f"DROP TABLE {quote(legacy)}"))
+
+        key_list = ", ".join(quote(col) for col in [*keys, partition_column])
+        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {quote(table + '_nk')} ON {quote(table)} ({key_list})"))
+
+
+def partition_months(conn, table, source, partition_column):
+    """Months (first days) of the rows of ``source``, which must all have a ``partition_column``."""
+    months = conn.execute(text(
+        f"SELECT DISTINCT date_trunc('month', {quote(partition_column)})::date FROM {quote(source)} ORDER BY 1"
+    )).scalars().all()
+    if None in months:
+        raise ValueError(f"{source} has rows without {partition_column}; they cannot be placed in a partition of {table}")
+    return months
+
+
+def rebuild_partitions(engine, table, source, columns, keys, partition_column):
+    """Rebuild every month of ``table`` that has rows in ``source``. Returns the months rebuilt."""
+    with engine.connect() as conn:
+        months = partition_months(conn, table, source, partition_column)
+    for month in months:
+        rebuild_partition(engine, table, source, columns, keys, partition_column, month)
+    return months
+
+
+def rebuild_partition(engine, table, source, columns, keys, partition_column, month):
+    """Build the ``month`` partition of ``table`` from ``source`` and the current partition, then swap it in."""
+    start_time = time.monotonic()
+    # Build the replacement outside the swap, so readers of the table are not blocked meanwhile
+    with engine.begin() as conn:
+        incoming, kept = build_partition(conn, table, source, columns, keys, partition_column, month)
+    with engine.begin() as conn:
+        swap_partition(conn, table, partition_column, month)
+
+    elapsed = time.monotonic() - start_time
+    logging.info(f"{partition_name(table, month)}: rebuilt in {elapsed:.2f}s ({incoming} incoming rows, {kept} kept)")
+
+
+def build_partition(conn, table, source, columns, keys, partition_column, month):
+    """Build the replacement of the ``month`` partition as ``<partition>__new``.
+
+    It holds the rows of ``source`` for the month and the rows of the current
+    partition that they do not replace. Returns the numbers of incoming and kept rows.
+    """
+    name = partition_name(table, month)
+    new = f"{name}__new"
+    bounds = {"lower": month, "upper": next_month(month)}
+    column_list = ", ".join(quote(col) for col in columns)
+    key_list = ", ".join(quote(key) for key in keys)
+    partition = quote(partition_column)
+
+    exists = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": quote(name)}).scalar()
+    conn.execute(text(f"DROP TABLE IF EXISTS {quote(new)}"))
+    conn.execute(text(f"CREATE TABLE {quote(new)} (LIKE {quote(table)} INCLUDING DEFAULTS)"))
+    incoming = conn.execute(text(
+        f"INSERT INTO {quote(new)} ({column_list}) "
+        f"SELECT DISTINCT ON ({key_list}) {column_list} FROM {quote(source)} "
+        f"WHERE {partition} >= :lower AND {partition} < :upper"
+    ), bounds).rowcount
+    kept = 0
+    if exists:
+        # Existing rows of the month that no incoming row replaces
+        all_columns = ", ".join(quote(col) for col in table_columns(conn, table))
+        matches = " AND ".join(f"n.{quote(key)} = o.{quote(key)}" for key in keys)
+        kept = conn.execute(text(
+            f"INSERT INTO {quote(new)} ({all_columns}) SELECT {all_columns} FROM {quote(name)} o "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {quote(new)} n WHERE {matches})"
+        )).rowcount
+    # Lets ATTACH PARTITION skip its validation scan
+    conn.execute(text(
+        f"ALTER TABLE {quote(new)} ADD CONSTRAINT {quote(name + '_bounds')} "
+        f"CHECK ({partition} IS NOT NULL AND {partition} >= :lower AND {partition} < :upper)"
+    ), bounds)
+    conn.execute(text(
+        f"CREATE UNIQUE INDEX {quote(new + '_nk')} ON {quote(new)} ({key_list}, {partition})"
+    ))
+    conn.execute(text(f"ANALYZE {quote(new)}"))
+    return incoming, kept
+
+
+def swap_partition(conn, table, partition_column, month):
+    """Replace the ``month`` partition of ``table`` by the table built by :func:`build_partition`."""
+    name = partition_name(table, month)
+    new = f"{name}__new"
+    bounds = {"lower": month, "upper": next_month(month)}
+    exists = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": quote(name)}).scalar()
+    if exists:
+        conn.execute(text(f"ALTER TABLE {quote(table)} DETACH PARTITION {quote(name)}"))
+        conn.execute(text(f"DROP TABLE {quote(name)}"))
+    conn.execute(text(f"ALTER TABLE {quote(new)} RENAME TO {quote(name)}"))
+    conn.execute(text(f"ALTER INDEX {quote(new + '_nk')} RENAME TO {quote(name + '_nk')}"))
+    conn.execute(text(
+        f"ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (:lower) TO (:upper)"
+    ), bounds)
+
+
+def partition_load(engine, df, table, keys, partition_column, batch_size=BATCH_SIZE, workers=1, types=None):
+    """Load ``df`` into the monthly partitioned ``table``.
+
+    Returns the number of rows staged and the months rebuilt (first days, as dates).
+    """
+    return partition_load_chunks(engine, [df], table, keys, partition_column, batch_size=batch_size, workers=workers,
+                                 types=types)
+
+
+def partition_load_chunks(engine, chunks, table, keys, partition_column, batch_size=BATCH_SIZE, workers=1, types=None):
+    """Load an iterable of DataFrames into the monthly partitioned ``table``.
+
+    Chunks are copied into an unlogged staging table as they arrive, split by
+    month across ``workers`` connections. The months present in the staged rows
+    are then rebuilt one at a time. Returns the number of rows staged and the
+    months rebuilt (first days, as dates).
+    """
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        return 0, []
+    first = first.assign(**{partition_column: pd.to_datetime(first[partition_column])})
+
+    stage = f"{table}__stage"
+    ensure_partitioned_table(engine, first, table, keys, partition_column, types)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {quote(stage)}"))
+        conn.execute(text(f"CREATE UNLOGGED TABLE {quote(stage)} (LIKE {quote(table)})"))
+
+    try:
+        rows = 0
+        for chunk in itertools.chain([first], chunks):
+            dates = pd.to_datetime(chunk[partition_column])
+            chunk = chunk.assign(**{partition_column: dates})
+            rows += copy_load(engine, chunk, stage, batch_size=batch_size, workers=workers,
+                              partition_by=dates.dt.to_period("M"))
+        months = rebuild_partitions(engine, table, stage, list(first.columns), keys, partition_column)
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {quote(stage)}"))
+
+    logging.info(f"{table}: loaded {rows} rows into {len(months)} monthly partition(s)")
+    return rows, months
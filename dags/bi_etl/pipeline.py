@@ -0,0 +1,26 @@
+"""Declarative description of the pipeline, read by the DAG file at parse time.
+
+``pipeline.json`` lists the source tables, the incrementally extracted ones
+with their watermark column, and each warehouse table with:
+
+* ``keys``: its natural key (or grain), which loads merge on;
+* ``partition_column``: for monthly range-partitioned tables;
+* ``inputs``: the staged source tables it is built from, each with the
+  columns read (``null`` reads every column);
+* ``transform``: for plain dimensions, the ``bi_etl.transforms`` function
+  building it from its inputs, in order. The DAG creates one load task per
+  such table, so a dimension of this kind is added by config alone.
+
+This module only uses the standard library: the scheduler parses the DAG file
+on every loop, and pandas and the database drivers are only imported inside
+the task callables.
+"""
+import json
+import os
+
+PIPELINE_CONFIG = os.environ.get("BI_PIPELINE_CONFIG", os.path.join(os.path.dirname(__file__), "pipeline.json"))
+
+
+def load_pipeline(path=PIPELINE_CONFIG):
+    with open(path) as f:
+        return json.load(f)
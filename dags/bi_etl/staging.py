@@ -0,0 +1,104 @@
+"""Columnar staging store for extracted source tables.
+
+Each extracted table is written once to an uncompressed Arrow IPC (Feather v2)
+file under ``STAGING_DIR``. Only a small handle with the path and the schema is
+passed through XCom; readers memory-map the file and load just the columns
+they use.
+"""
+import logging
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import feather
+
+from bi_etl.metrics import increment
+
+STAGING_DIR = os.environ.get("BI_STAGING_DIR", "/opt/airflow/staging")
+
+
+def staged_path(table):
+    """Return the staging file path for a source table."""
+    return os.path.join(STAGING_DIR, f"{table}.arrow")
+
+
+def write_staged(table, chunks):
+    """Write an iterable of DataFrame chunks to the staging file of ``table``.
+
+    Chunks are converted to Arrow as they arrive, so the only pandas frame held
+    in memory is the current chunk. Column types that differ between chunks
+    (e.g. int in one chunk, float with NULLs in the next) are promoted.
+    The file is written to a temporary name and renamed into place so that
+    readers never see a partial file.
+
+    Returns the XCom handle for the staged table.
+    """
+    batches = [pa.Table.from_pandas(chunk, preserve_index=False) for chunk in chunks]
+    if not batches:
+        raise ValueError(f"No data returned for table {table}")
+    arrow_table = pa.concat_tables(batches, promote_options="permissive")
+    # Categorical columns get one dictionary for the whole file, as the IPC file format requires.
+    # Dtype plans only ever widen, so the last chunk's pandas metadata matches the promoted types.
+    arrow_table = arrow_table.unify_dictionaries().replace_schema_metadata(batches[-1].schema.metadata)
+
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    path = staged_path(table)
+    tmp_path = f"{path}.tmp"
+    feather.write_feather(arrow_table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+    increment("bytes", os.path.getsize(path))
+
+    handle = {
+        "table": table,
+        "path": path,
+        "rows": arrow_table.num_rows,
+        "columns": {field.name: str(field.type) for field in arrow_table.schema},
+    }
+    logging.info(f"Staged {table}: {handle['rows']} rows -> {path}")
+    return handle
+
+
+def open_staged(handle, columns=None):
+    """Memory-map a staged table as an Arrow table, optionally restricted to ``columns``.
+
+    The columns are selected after mapping the whole file: ``feather.read_table``
+    with ``columns`` copies the file into memory instead of mapping it.
+    """
+    arrow_table = feather.read_table(handle["path"], memory_map=True)
+    if columns is None:
+        return arrow_table
+    missing = [col for col in columns if col not in handle["columns"]]
+    if missing:
+        raise ValueError(f"Staged table {handle['table']} is missing columns: {missing}")
+    return arrow_table.select(columns)
+
+
+def read_staged(handle, columns=None):
+    """Load a staged table as a DataFrame, optionally restricted to ``columns``."""
+    return open_staged(handle, columns).to_pandas()
+
+
+def read_staged_rows(arrow_table, column, values):
+    """Load the rows of a memory-mapped staged table whose ``column`` is in ``values``.
+
+    Only the matching rows are materialised, as a DataFrame indexed on ``column``.
+    """
+    value_set = pa.array(pd.unique(values.dropna())).cast(arrow_table.schema.field(column).type)
+    matching = arrow_table.filter(pc.is_in(arrow_table[column], value_set=value_set))
+    return matching.to_pandas().set_index(column)
+
+
+def iter_staged(handle, columns=None, batch_size=50000):
+    """Yield a staged table as DataFrames of at most ``batch_size`` rows.
+
+    The file is memory-mapped, so only the batch being converted is
+    materialised in memory.
+    """
+    for batch in open_staged(handle, columns).to_batches(max_chunksize=batch_size):
+        yield batch.to_pandas()
+
+
+def column_max(handle, column):
+    """Return the maximum of ``column`` in a staged table as a Python value."""
+    return pc.max(open_staged(handle, [column])[column]).as_py()
@@ -0,0 +1,224 @@
+"""Integer surrogate keys for the warehouse dimensions.
+
+Each dimension in :data:`DIMENSION_KEYS` has an INTEGER key column next to its
+natural ID. Keys are assigned 1, 2, ... as natural IDs are first loaded and
+never change afterwards. ``Order_Fact`` stores these keys instead of the
+natural IDs, so its rows are narrower and joins run on int4 columns::
+
+    SELECT ... FROM "Order_Fact" f JOIN "Customer_Dim" c ON c."Customer_Key" = f."Customer_Key"
+
+The natural -> surrogate map of each dimension is snapshotted to an Arrow file
+in the staging directory after each dimension load. Fact loads memory-map the
+snapshots and resolve whole chunks with one hash lookup per key column. A
+snapshot is rebuilt from the warehouse when the dimension's key count or
+highest key no longer match it.
+
+Natural IDs are compared as integers, so IDs read from TEXT columns (as
+written by the Access import) resolve to the same keys as numeric ones.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+from sqlalchemy import inspect, text
+
+from bi_etl.load import drop_duplicate_keys, merge_load, quote
+
+KEY_TYPE = "INTEGER"
+
+# dimension -> (natural ID column, surrogate key column)
+DIMENSION_KEYS = {
+    'Customer_Dim': ('Customer_ID', 'Customer_Key'),
+    'Organization_Dim': ('Employee_ID', 'Employee_Key'),
+    'Geography_Dim': ('Street_ID', 'Street_Key'),
+    'Product_Dim': ('Product_ID', 'Product_Key'),
+}
+
+# Column types for merge_load/partition_load, so that new tables get int4 keys
+KEY_COLUMN_TYPES = {key: KEY_TYPE for _, key in DIMENSION_KEYS.values()}
+
+
+def natural_ids(values):
+    """Natural IDs as nullable integers; values that are not integers become NA."""
+    return pd.to_numeric(pd.Series(values), errors='coerce').astype('Int64')
+
+
+def snapshot_path(cache_dir, dimension):
+    return os.path.join(cache_dir, "keys", f"{dimension}.arrow")
+
+
+def ensure_dimension_keys(conn, dimension):
+    """Add the key column to an existing dimension and number the rows that have no key yet.
+
+    A dimension written at another grain, with several rows per natural ID, is deduplicated first.
+    """
+    natural, key = DIMENSION_KEYS[dimension]
+    table = quote(dimension)
+    drop_duplicate_keys(conn, dimension, [natural])
+    columns = {col["name"] for col in inspect(conn).get_columns(dimension)}
+    if key not in columns:
+        logging.info(f"Adding surrogate key {key} to {dimension}")
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {quote(key)} {KEY_TYPE}"))
+    conn.execute(text(f"""
+        UPDATE {table} d SET {quote(key)} = n.key
+        FROM (
+            SELECT ctid, (SELECT coalesce(max({quote(key)}), 0) FROM {table})
+                         + row_number() OVER (ORDER BY {quote(natural)}) AS key
+            FROM {table} WHERE {quote(key)} IS NULL
+        ) n
+        WHERE d.ctid = n.ctid
+    """))
+    conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {quote(dimension + '_key')} ON {table} ({quote(key)})"))
+
+
+class KeyMap:
+    """The natural -> surrogate key map of one dimension."""
+
+    def __init__(self, dimension, naturals, keys):
+        self.dimension = dimension
+        self.natural, self.key = DIMENSION_KEYS[dimension]
+        self.naturals = np.asarray(naturals, dtype='int64')
+        self.keys = np.asarray(keys, dtype='int32')
+        self.index = pd.Index(self.naturals)
+
+    @classmethod
+    def load(cls, engine, dimension, cache_dir):
+        """Return the key map of ``dimension``, from its snapshot if that is still current."""
+        natural, key = DIMENSION_KEYS[dimension]
+        if not inspect(engine).has_table(dimension):
+            return cls(dimension, [], [])
+        with engine.begin() as conn:
+            ensure_dimension_keys(conn, dimension)
+            count, max_key = conn.execute(text(f"SELECT count(*), max({quote(key)}) FROM {quote(dimension)}")).one()
+
+        path = snapshot_path(cache_dir, dimension)
+        try:
+            with open(f"{path}.json") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        if saved == {"rows": count, "max_key": max_key}:
+            snapshot = feather.read_table(path, memory_map=True)
+            return cls(dimension, snapshot.column("natural").to_numpy(), snapshot.column("key").to_numpy())
+
+        with engine.connect() as conn:
+            rows = conn.execute(text(f"SELECT {quote(natural)}, {quote(key)} FROM {quote(dimension)}")).all()
+        naturals = natural_ids([row[0] for row in rows])
+        if naturals.isna().any():
+            logging.warning(f"{dimension}: {int(naturals.isna().sum())} rows have a non-integer {natural}; they cannot be resolved")
+        valid = naturals.notna().to_numpy()
+        key_map = cls(dimension, naturals[valid].to_numpy(), np.array([row[1] for row in rows])[valid])
+        key_map.save_snapshot(cache_dir, max_key)
+        return key_map
+
+    def save_snapshot(self, cache_dir, max_key=None):
+        path = snapshot_path(cache_dir, self.dimension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        feather.write_feather(pa.table({"natural": self.naturals, "key": self.keys}), f"{path}.tmp", compression="uncompressed")
+        os.replace(f"{path}.tmp", path)
+        if max_key is None:
+            max_key = int(self.keys.max()) if len(self.keys) else None
+        with open(f"{path}.json.tmp", "w") as f:
+            json.dump({"rows": len(self.keys), "max_key": max_key}, f)
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+
+    def lookup(self, values):
+        """Surrogate keys of ``values`` as a nullable Int32 array; NA where a natural ID is unknown."""
+        positions = self.index.get_indexer(natural_ids(values).array)
+        if not len(self.keys):
+            return pd.array([pd.NA] * len(positions), dtype='Int32')
+        keys = pd.array(self.keys[positions], dtype='Int32')
+        keys[positions < 0] = pd.NA
+        return keys
+
+    def assign(self, df):
+        """Return ``df`` with its key column, numbering natural IDs not seen before after the highest key."""
+        keys = self.lookup(df[self.natural])
+        new = natural_ids(df.loc[keys.isna(), self.natural]).dropna().drop_duplicates().sort_values().to_numpy(dtype='int64')
+        if len(new):
+            start = int(self.keys.max()) + 1 if len(self.keys) else 1
+            self.naturals = np.concatenate([self.naturals, new])
+            self.keys = np.concatenate([self.keys, np.arange(start, start + len(new), dtype='int32')])
+            self.index = pd.Index(self.naturals)
+            keys = self.lookup(df[self.natural])
+            logging.info(f"{self.dimension}: {len(new)} new {self.key} values from {start}")
+        return df.assign(**{self.key: keys})
+
+    def save(self, engine, cache_dir):
+        """Index the key column of the dimension and snapshot the map, once the dimension has been loaded."""
+        with engine.begin() as conn:
+            ensure_dimension_keys(conn, self.dimension)
+        self.save_snapshot(cache_dir)
+
+
+class FactKeys:
+    """Replaces the natural IDs of fact rows with the dimensions' surrogate keys."""
+
+    def __init__(self, key_maps):
+        self.key_maps = key_maps
+        self.unresolved = {key_map.key: 0 for key_map in key_maps}
+
+    @classmethod
+    def load(cls, engine, cache_dir, dimensions=DIMENSION_KEYS):
+        return cls([KeyMap.load(engine, dimension, cache_dir) for dimension in dimensions])
+
+    def resolve(self, df):
+        """Return ``df`` with each natural ID column replaced, in place, by its key column."""
+        columns = list(df.columns)
+        resolved = {}
+        for key_map in self.key_maps:
+            if key_map.natural not in df.columns:
+                continue
+            keys = key_map.lookup(df[key_map.natural])
+            self.unresolved[key_map.key] += int((keys.isna() & df[key_map.natural].notna().to_numpy()).sum())
+            resolved[key_map.key] = keys
+            columns[columns.index(key_map.natural)] = key_map.key
+        return df.assign(**resolved)[columns]
+
+    def resolve_chunks(self, chunks):
+        """Resolve an iterable of fact chunks, logging the IDs that no dimension row matched at the end."""
+        for chunk in chunks:
+            yield self.resolve(chunk)
+        self.report()
+
+    def report(self):
+        for key, count in self.unresolved.items():
+            if count:
+                logging.warning(f"{count} fact rows reference a natural ID with no {key}; the key is left NULL")
+
+
+def migrate_fact(engine, table, dimensions=DIMENSION_KEYS):
+    """Replace natural ID columns of an existing fact table by surrogate keys, once.
+
+    The dimensions must already have their keys (see :meth:`KeyMap.load`).
+    """
+    with engine.begin() as conn:
+        if not inspect(conn).has_table(table):
+            return
+        columns = {col["name"] for col in inspect(conn).get_columns(table)}
+        for dimension in dimensions:
+            natural, key = DIMENSION_KEYS[dimension]
+            if natural not in columns:
+                continue
+            logging.warning(f"{table}: replacing {natural} by {key}")
+            if key not in columns:
+                conn.execute(text(f"ALTER TABLE {quote(table)} ADD COLUMN {quote(key)} {KEY_TYPE}"))
+            if inspect(conn).has_table(dimension):
+                conn.execute(text(
+                    f"UPDATE {quote(table)} f SET {quote(key)} = d.{quote(key)} FROM {quote(dimension)} d "
+                    f"WHERE d.{quote(natural)}::text = f.{quote(natural)}::text"
+                ))
+            conn.execute(text(f"ALTER TABLE {quote(table)} DROP COLUMN {quote(natural)}"))
+
+
+def load_dimension(engine, df, dimension, keys, cache_dir):
+    """Merge-load a dimension with its surrogate keys assigned. Returns the number of rows written."""
+    key_map = KeyMap.load(engine, dimension, cache_dir)
+    df = key_map.assign(df)
+    rows = merge_load(engine, df, dimension, keys, types=KEY_COLUMN_TYPES)
+    key_map.save(engine, cache_dir)
+    return rows
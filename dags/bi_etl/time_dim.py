@@ -0,0 +1,39 @@
+"""Time_Dim generation.
+
+The calendar is driven by the order dates found in the source and extended in
+whole years. Only dates outside the range already loaded are generated, with
+vectorised datetime accessors for the derived columns.
+"""
+import pandas as pd
+
+
+def build_time_dim(start, end):
+    """Return the Time_Dim rows for every date from ``start`` to ``end`` inclusive."""
+    dates = pd.Series(pd.date_range(start=start, end=end), name='Date_ID')
+    return pd.DataFrame({
+        'Date_ID': dates,
+        'Year_ID': dates.dt.year.astype(str),
+        'Quarter': 'Q' + dates.dt.quarter.astype(str),
+        'Month_Name': dates.dt.month_name(),
+        'Weekday_Name': dates.dt.day_name(),
+        'Month_Num': dates.dt.month,
+        'Weekday_Num': dates.dt.weekday,
+    })
+
+
+def missing_date_ranges(first_date, last_date, loaded_start=None, loaded_end=None):
+    """Return the (start, end) ranges needed to cover whole years from ``first_date`` to ``last_date``.
+
+    ``loaded_start``/``loaded_end`` is the contiguous range already in Time_Dim.
+    """
+    start = pd.Timestamp(year=pd.Timestamp(first_date).year, month=1, day=1)
+    end = pd.Timestamp(year=pd.Timestamp(last_date).year, month=12, day=31)
+    if loaded_start is None or loaded_end is None:
+        return [(start, end)]
+
+    ranges = []
+    if start < pd.Timestamp(loaded_start):
+        ranges.append((start, pd.Timestamp(loaded_start) - pd.Timedelta(days=1)))
+    if end > pd.Timestamp(loaded_end):
+        ranges.append((pd.Timestamp(loaded_end) + pd.Timedelta(days=1), end))
+    return ranges
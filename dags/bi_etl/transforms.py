@@ -0,0 +1,45 @@
+"""DataFrame transforms for the warehouse dimensions.
+
+Each ``build_*`` function takes the source frames read from the staging store
+and returns the frame loaded into the matching warehouse table. They hold no
+database or Airflow state, so they can also be timed on their own.
+"""
+import pandas as pd
+
+
+def build_customer_dim(customer_df):
+    """Customer_Dim: the customer table with warehouse column names."""
+    return customer_df.rename(columns={
+        'customer_id': 'Customer_ID', 'country': 'Customer_Country', 'customer_type': 'Customer_Type',
+        'gender': 'Customer_Gender', 'age_group': 'Customer_Age_Group', 'age': 'Customer_Age',
+        'name': 'Customer_Name', 'firstname': 'Customer_Firstname', 'lastname': 'Customer_Lastname',
+        'birth_date': 'Customer_Birth_Date'
+    })
+
+
+def build_organization_dim(organization_df):
+    """Organization_Dim: the organization table with warehouse column names."""
+    return organization_df.rename(columns={
+        'employee_id': 'Employee_ID', 'country': 'Employee_Country', 'company': 'Company',
+        'department': 'Department', 'section': 'Section', 'org_group': 'Org_Group',
+        'job_title': 'Job_Title', 'name': 'Employee_Name', 'gender': 'Employee_Gender',
+        'salary': 'Salary', 'birth_date': 'Employee_Birth_Date', 'hire_date': 'Employee_Hire_Date',
+        'term_date': 'Employee_Term_Date'
+    })
+
+
+def build_product_dim(product_list_df, product_level_df, supplier_df):
+    """Product_Dim: products with their level and supplier."""
+    product_dim_df = pd.merge(product_list_df, product_level_df, left_on='Product_Level', right_on='Product_Level')
+    product_dim_df = pd.merge(product_dim_df, supplier_df, left_on='Supplier_ID', right_on='Supplier_ID')
+    product_dim_df = product_dim_df.rename(columns={'Country': 'Supplier_Country'})
+    return product_dim_df[['Product_ID', 'Product_Name', 'Supplier_ID', 'Product_Level', 'Product_Ref_ID', 'Supplier_Country', 'Supplier_Name']]
+
+
+def build_geography_dim(street_code_df, lookups):
+    """Geography_Dim: one row per street, resolved to city, country and continent.
+
+    ``lookups`` is a :class:`bi_etl.geography.GeographyLookups` built from the
+    city, continent and country tables.
+    """
+    return lookups.resolve(street_code_df)
@@ -0,0 +1,250 @@
+"""Data-quality checks run in the MySQL source before extraction.
+
+Each table in :data:`SOURCE_RULES` is checked with a few cheap queries, so a
+bad source fails the run before anything is extracted:
+
+* schema: the columns the warehouse loads read exist (from ``information_schema``);
+  they are the ``inputs`` columns of ``pipeline.json``, plus the key and
+  profiled columns of each table's rules;
+* row count: the table is not empty, and did not shrink by more than
+  ``ROW_DROP_WARN`` since the last run;
+* null rates: key and required columns stay under their allowed share of NULLs;
+* uniqueness: the key has no duplicates, unless a unique index already
+  guarantees it.
+
+Tables whose estimated size is above ``EXACT_MAX_ROWS`` are profiled on the
+newest ``SAMPLE_ROWS`` rows by key instead of a full scan; those results are
+flagged as sampled. Every result is stored per run in the
+``etl_validation_results`` table of the warehouse, so drift can be followed
+from run to run.
+"""
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from bi_etl.pipeline import load_pipeline
+
+VALIDATION_TABLE = "etl_validation_results"
+
+# Tables above this many (estimated) rows are profiled on SAMPLE_ROWS rows
+EXACT_MAX_ROWS = 1_000_000
+SAMPLE_ROWS = 100_000
+
+# A row count below this share of the last run's count is reported as a warning
+ROW_DROP_WARN = 0.5
+
+# table -> key columns, {column: allowed share of NULLs}, and optionally 'extra_columns': columns read
+# downstream of the warehouse table rather than by its load (not listed in pipeline.json)
+SOURCE_RULES = {
+    'orders': {
+        'key': ['Order_ID'],
+        'max_null_rate': {'Order_ID': 0, 'Customer_ID': 0, 'Order_Date': 0},
+    },
+    'order_item': {
+        'key': ['Order_ID', 'Order_Item_Num'],
+        'max_null_rate': {'Order_ID': 0, 'Order_Item_Num': 0, 'Product_ID': 0},
+    },
+    'customer': {
+        'key': ['Customer_ID'],
+        'extra_columns': ['Country', 'Customer_Type_ID'],  # read by the sales rollups through Customer_Dim
+        'max_null_rate': {'Customer_ID': 0},
+    },
+    'organization': {
+        'key': ['Employee_ID'],
+        'max_null_rate': {'Employee_ID': 0},
+    },
+    'product_list': {
+        'key': ['Product_ID'],
+        'max_null_rate': {'Product_ID': 0},
+    },
+    'product_level': {
+        'key': ['Product_Level'],
+        'max_null_rate': {'Product_Level': 0},
+    },
+    'supplier': {
+        'key': ['Supplier_ID'],
+        'max_null_rate': {'Supplier_ID': 0},
+    },
+    'street_code': {
+        'key': ['Street_ID'],
+        'max_null_rate': {'Street_ID': 0},
+    },
+    'city': {
+        'key': ['City_ID'],
+        'max_null_rate': {'City_ID': 0},
+    },
+    'continent': {
+        'key': ['Continent_ID'],
+        'max_null_rate': {'Continent_ID': 0},
+    },
+    'country': {
+        'key': ['Country'],
+        'max_null_rate': {'Country': 0, 'Country_ID': 0},
+    },
+}
+
+
+def read_columns(pipeline):
+    """Source table -> the columns the warehouse tables of ``pipeline`` read from it, in order."""
+    read = {}
+    for definition in pipeline['warehouse_tables'].values():
+        for source, columns in definition.get('inputs', {}).items():
+            listed = read.setdefault(source, [])
+            listed.extend(col for col in columns or [] if col not in listed)
+    return read
+
+
+def required_columns(table, rules, read):
+    """Columns of ``table`` that must exist: those read by the loads, its key and its profiled columns."""
+    required = []
+    for col in [*read.get(table, []), *rules['key'], *rules['max_null_rate'], *rules.get('extra_columns', [])]:
+        if col not in required:
+            required.append(col)
+    return required
+
+
+def result(table, check, status, column=None, value=None, threshold=None, sampled=False, detail=None):
+    return {
+        "table_name": table, "check_name": check, "column_name": column, "status": status,
+        "value": value, "threshold": threshold, "sampled": sampled, "detail": detail,
+    }
+
+
+def source_catalog(conn):
+    """Columns, estimated row counts and unique indexes of every table in the current MySQL schema."""
+    columns = {}
+    for table, column in conn.execute(text(
+        "SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()"
+    )):
+        columns.setdefault(table.lower(), {})[column.lower()] = column
+    estimates = {
+        table.lower(): rows or 0
+        for table, rows in conn.execute(text(
+            "SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()"
+        ))
+    }
+    unique_indexes = {}
+    for table, index, column in conn.execute(text(
+        "SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND NON_UNIQUE = 0 ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX"
+    )):
+        unique_indexes.setdefault(table.lower(), {}).setdefault(index, []).append(column.lower())
+    return columns, estimates, unique_indexes
+
+
+def check_table(conn, table, rules, required, columns, estimate, unique_indexes, previous_rows=None,
+                exact_max_rows=EXACT_MAX_ROWS, sample_rows=SAMPLE_ROWS):
+    """Run the checks of one table and return their results."""
+    if columns is None:
+        return [result(table, "schema", "fail", detail="table does not exist")]
+    missing = [col for col in required if col.lower() not in columns]
+    results = [result(table, "schema", "fail" if missing else "ok", value=len(missing),
+                      detail=f"missing columns: {missing}" if missing else None)]
+    if missing:
+        return results
+
+    sampled = estimate > exact_max_rows
+    source = f"`{table}`"
+    if sampled:
+        # The newest rows in key order: read backwards through the key index, and where a broken
+        # extract or new upstream data shows up first (the oldest rows were already validated)
+        order = ", ".join(f"`{columns[col.lower()]}` DESC" for col in rules['key'])
+        source = f"(SELECT * FROM `{table}` ORDER BY {order} LIMIT {int(sample_rows)}) s"
+
+    key_columns = [columns[col.lower()] for col in rules['key']]
+    key_is_unique = any([col.lower() for col in key_columns] == index for index in unique_indexes.values())
+    profiled = list(rules['max_null_rate'])
+    expressions = ["COUNT(*)"] + [f"COUNT(`{columns[col.lower()]}`)" for col in profiled]
+    if not key_is_unique:
+        key_list = ", ".join(f"`{col}`" for col in key_columns)
+        expressions.append(f"(SELECT COUNT(*) FROM (SELECT 1 FROM {source} GROUP BY {key_list} HAVING COUNT(*) > 1) d)")
+    values = conn.execute(text(f"SELECT {', '.join(expressions)} FROM {source}")).one()
+    rows = values[0]
+
+    if sampled:
+        results.append(result(table, "row_count", "ok" if estimate else "fail", value=estimate, sampled=True,
+                              detail="estimated from information_schema"))
+        rows_total = estimate
+    else:
+        rows_total = rows
+        results.append(result(table, "row_count", "ok" if rows else "fail", value=rows, detail=None if rows else "table is empty"))
+    if previous_rows and rows_total < previous_rows * ROW_DROP_WARN:
+        results.append(result(table, "row_drift", "warn", value=rows_total, threshold=previous_rows * ROW_DROP_WARN,
+                              sampled=sampled, detail=f"{previous_rows} rows in the last run"))
+
+    for col, non_null in zip(profiled, values[1:1 + len(profiled)]):
+        null_rate = (rows - non_null) / rows if rows else 0.0
+        threshold = rules['max_null_rate'][col]
+        results.append(result(table, "null_rate", "fail" if null_rate > threshold else "ok", column=col,
+                              value=null_rate, threshold=threshold, sampled=sampled))
+
+    if key_is_unique:
+        results.append(result(table, "unique_key", "ok", column=",".join(rules['key']), value=0, detail="unique index"))
+    else:
+        duplicates = values[-1]
+        results.append(result(table, "unique_key", "fail" if duplicates else "ok", column=",".join(rules['key']),
+                              value=duplicates, threshold=0, sampled=sampled,
+                              detail=f"{duplicates} duplicated keys" if duplicates else None))
+    return results
+
+
+def validate_source(engine, tables, previous_rows=None, rules=SOURCE_RULES, pipeline=None):
+    """Check every table of ``tables`` that has rules and return the results."""
+    previous_rows = previous_rows or {}
+    read = read_columns(pipeline or load_pipeline())
+    results = []
+    with engine.connect() as conn:
+        columns, estimates, unique_indexes = source_catalog(conn)
+        for table in tables:
+            if table not in rules:
+                continue
+            results.extend(check_table(
+                conn, table, rules[table], required_columns(table, rules[table], read), columns.get(table.lower()), estimates.get(table.lower(), 0),
+                unique_indexes.get(table.lower(), {}), previous_rows.get(table),
+            ))
+    for failure in (res for res in results if res["status"] != "ok"):
+        log = logging.error if failure["status"] == "fail" else logging.warning
+        log(f"{failure['table_name']}: {failure['check_name']} {failure['column_name'] or ''} "
+            f"{failure['status']} (value {failure['value']}, threshold {failure['threshold']}) {failure['detail'] or ''}")
+    return results
+
+
+def previous_row_counts(engine):
+    """Row counts of each table in the latest run that stored results, for the drift check."""
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(text(f"""
+                SELECT DISTINCT ON (table_name) table_name, value FROM {VALIDATION_TABLE}
+                WHERE check_name = 'row_count' ORDER BY table_name, checked_at DESC
+            """)).all()
+    except Exception:
+        return {}  # no results stored yet
+    return {table: value for table, value in rows}
+
+
+def store_results(engine, run_id, results):
+    """Append a run's results to the validation table in the warehouse."""
+    checked_at = datetime.now(timezone.utc)
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {VALIDATION_TABLE} (
+                run_id TEXT,
+                checked_at TIMESTAMPTZ NOT NULL,
+                table_name TEXT NOT NULL,
+                check_name TEXT NOT NULL,
+                column_name TEXT,
+                status TEXT NOT NULL,
+                value DOUBLE PRECISION,
+                threshold DOUBLE PRECISION,
+                sampled BOOLEAN NOT NULL,
+                detail TEXT
+            )
+        """))
+        if results:
+            conn.execute(text(f"""
+                INSERT INTO {VALIDATION_TABLE}
+                    (run_id, checked_at, table_name, check_name, column_name, status, value, threshold, sampled, detail)
+                VALUES
+                    (:run_id, :checked_at, :table_name, :check_name, :column_name, :status, :value, :threshold, :sampled, :detail)
+            """), [{**res, "run_id": run_id, "checked_at": checked_at} for res in results])
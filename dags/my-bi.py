@@ -1,30 +1,58 @@
 import logging
-import time
-from datetime import datetime
+import os
+from datetime import date, datetime
 from airflow.models.dag import DAG
 from airflow.decorators import task
-from airflow.providers.mysql.hooks.mysql import MySqlHook
-from airflow.providers.postgres.hooks.postgres import PostgresHook
-import pandas as pd
-from io import StringIO
-from sqlalchemy import create_engine
+from bi_etl.pipeline import load_pipeline
 
+# The scheduler re-parses this file on every DAG-processor loop. Only Airflow and the standard
+# library are imported here; pandas, SQLAlchemy, the provider hooks and the bi_etl helpers that
+# use them are imported inside the task callables.
 
-tables_mysql_source = [
-    'city', 'continent', 'country', 'county', 'customer', 'customer_type', 'discount',
-    'geo_type', 'order_item', 'orders', 'org_level', 'organization', 'postal_code',
-    'price_list', 'product_level', 'product_list', 'state', 'street_code', 'supplier'
-]
+# Source tables, warehouse tables and their transforms are declared in bi_etl/pipeline.json
+pipeline = load_pipeline()
 
+tables_mysql_source = pipeline['source_tables']
 
-tables_postgresql_dataWarehouse = [
-    'Customer_Dim', 'Organization_Dim', 'Order_Fact', 'Product_Dim', 'Geography_Dim', 'Time_Dim'
-]
+# Tables extracted incrementally, with their high-water-mark column.
+# Only rows above the last committed watermark are pulled; pass a table name
+# in the 'full_refresh' DAG param to re-extract it in full.
+incremental_tables = pipeline['incremental_tables']
+
+tables_postgresql_dataWarehouse = list(pipeline['warehouse_tables'])
+
+# Natural key (or grain) of each warehouse table; loads merge on these columns
+warehouse_keys = {table: definition['keys'] for table, definition in pipeline['warehouse_tables'].items()}
+
+# Tables stored as monthly range partitions, with their partition column.
+# Loads rebuild only the months present in the new rows and swap them in.
+partitioned_tables = {
+    table: definition['partition_column']
+    for table, definition in pipeline['warehouse_tables'].items()
+    if 'partition_column' in definition
+}
+
+# Staged inputs of each warehouse table, with the columns read from each
+warehouse_inputs = {table: definition.get('inputs', {}) for table, definition in pipeline['warehouse_tables'].items()}
+
+# Dimensions joined by the sales rollups (bi_etl.rollups); a rollup is rebuilt in full when one of its
+# dimensions' inputs changed
+rollup_dimensions = ['Customer_Dim', 'Product_Dim', 'Geography_Dim']
+
+# Dimensions built by a single transform from their inputs, each loaded by its own generated task
+plain_dimensions = {table: definition for table, definition in pipeline['warehouse_tables'].items() if 'transform' in definition}
 
 
 mysql_conn_id = 'mysql'
 postgres_conn_id = 'postgres'
 
+# Airflow pools capping concurrent tasks against each database (created by airflow-init)
+mysql_source_pool = 'mysql_source'
+postgres_warehouse_pool = 'postgres_warehouse'
+
+# Parallel COPY connections used to stage the Order_Fact load
+order_fact_copy_workers = 4
+
 # Default arguments for the DAG
 default_args = {
     'owner': 'airflow',
@@ -32,164 +60,221 @@ default_args = {
     'retries': 1,
 }
 
+
+def dimension_task(table, definition):
+    """
+    Builds the load task of a plain dimension declared in pipeline.json.
+    """
+    @task(task_id=f'transform_and_load_{table.lower()}', pool=postgres_warehouse_pool)
+    def transform_and_load_dimension(handles, run_id=None):
+        """
+        Transforms the staged inputs with the dimension's transform and loads it into PostgreSQL.
+
+        ``handles`` are the staged inputs in the order of the config, passed as one list: Airflow
+        reserves context names such as ``run_id``, so they cannot follow a ``*handles`` argument.
+        """
+        from bi_etl import transforms
+        from bi_etl.connections import postgres_engine
+        from bi_etl.fingerprints import unchanged
+        from bi_etl.metrics import stage
+        from bi_etl.staging import STAGING_DIR, read_staged
+        from bi_etl.surrogate_keys import load_dimension
+
+        if None in handles:
+            logging.warning(f"One or more staged inputs of {table} are None. Skipping transformation and load.")
+            return {'loaded': False}
+        if unchanged(*handles):
+            print(f"{table} inputs unchanged; skipping")
+            return {'loaded': True}
+        engine = postgres_engine(postgres_conn_id)
+        with stage(f"transform.{table}", run_id, engine) as metrics:
+            input_dfs = [read_staged(handle, columns=columns) for handle, columns in zip(handles, definition['inputs'].values())]
+            dim_df = getattr(transforms, definition['transform'])(*input_dfs)
+            metrics.rows_in, metrics.rows_out = handles[0]['rows'], len(dim_df)
+        with stage(f"load.{table}", run_id, engine) as metrics:
+            metrics.rows_in = len(dim_df)
+            metrics.rows_out = load_dimension(engine, dim_df, table, warehouse_keys[table], STAGING_DIR)
+        print(f"{table} loaded")
+        return {'loaded': True}
+
+    return transform_and_load_dimension
+
+
 # Define the DAG
 with DAG(
     dag_id='bi-transform-completed',
     default_args=default_args,
     schedule_interval=None,  # Run manually
     catchup=False,
+    max_active_runs=1,  # runs share the staging files
+    params={
+        'full_refresh': [],  # tables to extract in full, e.g. ["orders"]
+        'order_fact_engine': 'sql',  # 'sql' joins in MySQL, 'chunked' streams the staged tables, 'pandas' merges them in memory
+    },
 ) as dag:
 
 
  
         
-    @task(task_id='extract_table')
-    def extract_table(table):
+    @task(task_id='validate_sources', pool=mysql_source_pool)
+    def validate_sources(run_id=None):
+        """
+        Runs the data-quality checks on the MySQL source and stores their results for this run.
+        Fails the run, before anything is extracted, if a check fails.
+        """
+        from bi_etl.connections import mysql_engine, postgres_engine
+        from bi_etl.metrics import stage
+        from bi_etl.validation import previous_row_counts, store_results, validate_source
+
+        engine = postgres_engine(postgres_conn_id)
+        with stage("validate", run_id, engine) as metrics:
+            results = validate_source(mysql_engine(mysql_conn_id), tables_mysql_source, previous_row_counts(engine))
+            metrics.rows_out = len(results)
+        store_results(engine, run_id, results)
+
+        failures = [res for res in results if res['status'] == 'fail']
+        if failures:
+            raise ValueError(f"{len(failures)} source checks failed: " + ", ".join(
+                f"{res['table_name']}.{res['check_name']}" + (f"({res['column_name']})" if res['column_name'] else '')
+                for res in failures
+            ))
+        logging.info(f"Source validation passed ({len(results)} checks)")
+
+    @task(task_id='extract_table', pool=mysql_source_pool)
+    def extract_table(table, params=None, run_id=None):
+        import pandas as pd
+        from sqlalchemy import text
+        from bi_etl.connections import mysql_engine, postgres_engine
+        from bi_etl.dtypes import DtypePlanner
+        from bi_etl.fingerprints import reusable_handle, table_fingerprint
+        from bi_etl.metrics import stage
+        from bi_etl.staging import STAGING_DIR, column_max, write_staged
+        from bi_etl.watermarks import get_watermark, to_watermark
+
         try:
-            mysql_hook = MySqlHook(mysql_conn_id=mysql_conn_id)
-            sql = f"SELECT * FROM {table}"
-            chunks = []
-            for chunk in pd.read_sql(sql, mysql_hook.get_sqlalchemy_engine(), chunksize=10000):
-                chunks.append(chunk)
-            df = pd.concat(chunks, ignore_index=True)
-            print(f"Extracted data from {table}: {df.shape[0]} rows")
-            return df.to_json(orient='split')
+            watermark_column = incremental_tables.get(table)
+            full_refresh = table in (params or {}).get('full_refresh', [])
+            watermark = None if full_refresh or not watermark_column else get_watermark(table)
+
+            # Fully extracted tables are skipped when their checksum matches the last successful run
+            fingerprint = None
+            if not watermark_column:
+                fingerprint = table_fingerprint(mysql_engine(mysql_conn_id), table)
+                handle = None if full_refresh else reusable_handle(table, fingerprint)
+                if handle is not None:
+                    handle['changed'] = False
+                    print(f"{table} unchanged since the last run; reusing {handle['path']}")
+                    return handle
+
+            if watermark is None:
+                sql = text(f"SELECT * FROM {table}")
+            else:
+                sql = text(f"SELECT * FROM {table} WHERE {watermark_column} > :watermark")
+            with stage(f"extract.{table}", run_id, postgres_engine(postgres_conn_id)) as metrics:
+                chunks = pd.read_sql(sql, mysql_engine(mysql_conn_id), params={'watermark': watermark}, chunksize=10000)
+                # Compact dtypes are fixed once per table, so every chunk and every reader sees the same types
+                planner = DtypePlanner(table, cache_dir=STAGING_DIR)
+                handle = write_staged(table, planner.apply(chunks))
+                handle['memory'] = planner.report()
+                metrics.rows_in = metrics.rows_out = handle['rows']
+            handle['mode'] = 'full' if watermark is None else 'incremental'
+            handle['fingerprint'] = fingerprint
+            handle['changed'] = handle['rows'] > 0 if handle['mode'] == 'incremental' else True
+
+            if watermark_column:
+                handle['previous_watermark'] = watermark
+                new_watermark = to_watermark(column_max(handle, watermark_column))
+                handle['watermark'] = watermark if new_watermark is None else new_watermark
+            print(f"Extracted data from {table} ({handle['mode']}): {handle['rows']} rows")
+            return handle
         except Exception as e:
             print(f"Error extracting data from MySQL for table {table}: {e}")
             return None
-  
-    extracted_data = {}
-    for table in tables_mysql_source:
-        extracted_data[table] = extract_table(table=table)
-
 
-    @task(task_id='transform_and_load_customer_dim')
-    def transform_and_load_customer_dim(customer_json):
+    @task(task_id='collect_extracts', multiple_outputs=True)
+    def collect_extracts(handles):
         """
-        Transforms and loads data into the Customer_Dim table in PostgreSQL.
+        Maps the extract_table outputs (in map index order) back to their table names.
         """
-        if customer_json is None:
-            return
-        customer_df = pd.read_json(customer_json, orient='split')
-        customer_df = customer_df.rename(columns={
-            'customer_id': 'Customer_ID', 'country': 'Customer_Country', 'customer_type': 'Customer_Type',
-            'gender': 'Customer_Gender', 'age_group': 'Customer_Age_Group', 'age': 'Customer_Age',
-            'name': 'Customer_Name', 'firstname': 'Customer_Firstname', 'lastname': 'Customer_Lastname',
-            'birth_date': 'Customer_Birth_Date'
-        })
-        postgres_hook = PostgresHook(postgres_conn_id=postgres_conn_id)
-        engine = create_engine(postgres_hook.get_uri())
-        customer_df.to_sql('Customer_Dim', engine, if_exists='replace', index=False)
-        print("Customer_Dim loaded")
-        
-        
-        
+        return dict(zip(tables_mysql_source, handles))
 
-    @task(task_id='transform_and_load_organization_dim')
-    def transform_and_load_organization_dim(organization_json):
-        """
-        Transforms and loads data into the Organization_Dim table in PostgreSQL.
-        """
-        if organization_json is None:
-            return
-        organization_df = pd.read_json(organization_json, orient='split')
-        organization_df = organization_df.rename(columns={
-            'employee_id': 'Employee_ID', 'country': 'Employee_Country', 'company': 'Company',
-            'department': 'Department', 'section': 'Section', 'org_group': 'Org_Group',
-            'job_title': 'Job_Title', 'name': 'Employee_Name', 'gender': 'Employee_Gender',
-            'salary': 'Salary', 'birth_date': 'Employee_Birth_Date', 'hire_date': 'Employee_Hire_Date',
-            'term_date': 'Employee_Term_Date'
-        })
-        postgres_hook = PostgresHook(postgres_conn_id=postgres_conn_id)
-        engine = create_engine(postgres_hook.get_uri())
-        organization_df.to_sql('Organization_Dim', engine, if_exists='replace', index=False)
-        print("Organization_Dim loaded")
-
-
-    @task(task_id='transform_and_load_order_fact')
-    def transform_and_load_order_fact(orders_json, order_item_json, customer_json, organization_json, product_json, street_code_json):
+    extracts = extract_table.expand(table=tables_mysql_source)
+    validate_sources() >> extracts
+    extracted_data = collect_extracts(extracts)
+
+
+    @task(task_id='transform_and_load_order_fact', pool=postgres_warehouse_pool)
+    def transform_and_load_order_fact(orders, order_item, customer, organization, product, street_code, params=None, run_id=None):
         """
         Transforms and loads data into the Order_Fact table in PostgreSQL.
+
+        With the 'sql' engine the joins run as one statement on the MySQL source and the result is
+        streamed into the warehouse. The 'chunked' engine joins bounded batches of the staged
+        order_item table against indexed lookups, and the 'pandas' engine merges the staged
+        tables in the worker's memory.
+
+        Natural IDs are replaced by the dimensions' surrogate keys, so the dimension loads run first.
+        Returns whether Order_Fact is up to date with this run's extracts ('loaded'), which gates the
+        watermark commit, and the months that were rebuilt, for the rollup refresh.
         """
-        if orders_json is None or order_item_json is None or customer_json is None or organization_json is None or product_json is None or street_code_json is None:
-            logging.warning("One or more input JSONs are None. Skipping transformation and load.")
-            return
+        from bi_etl.connections import mysql_engine, postgres_engine
+        from bi_etl.fingerprints import unchanged
+        from bi_etl.metrics import stage
+        from bi_etl.order_fact import build_order_fact, chunked_order_fact, stream_order_fact
+        from bi_etl.partitions import partition_load, partition_load_chunks
+        from bi_etl.staging import STAGING_DIR, read_staged
+        from bi_etl.surrogate_keys import KEY_COLUMN_TYPES, FactKeys, migrate_fact
+
+        if orders is None or order_item is None or customer is None or organization is None or product is None or street_code is None:
+            logging.warning("One or more staged inputs are None. Skipping transformation and load.")
+            return {'loaded': False, 'months': []}
+
+        if unchanged(orders, order_item, customer, organization, product, street_code):
+            logging.info("Order_Fact inputs unchanged; skipping")
+            return {'loaded': True, 'months': []}
+
+        engine = postgres_engine(postgres_conn_id)
+        fact_keys = FactKeys.load(engine, STAGING_DIR)
+        migrate_fact(engine, 'Order_Fact')
+        # The streaming engines transform and load in one pass, so they are measured as one stage
+        if (params or {}).get('order_fact_engine') == 'sql':
+            # Same Order_ID range as the staged orders extract
+            lower = orders['previous_watermark'] if orders['mode'] == 'incremental' else None
+            with stage("load.Order_Fact", run_id, engine) as metrics:
+                chunks = fact_keys.resolve_chunks(stream_order_fact(mysql_engine(mysql_conn_id), lower=lower, upper=orders.get('watermark')))
+                metrics.rows_in = order_item['rows']
+                metrics.rows_out, months = partition_load_chunks(engine, chunks, 'Order_Fact', warehouse_keys['Order_Fact'], partitioned_tables['Order_Fact'], workers=order_fact_copy_workers, types=KEY_COLUMN_TYPES)
+            logging.info("Order_Fact loaded successfully (SQL engine)")
+            return {'loaded': True, 'months': [month.isoformat() for month in months]}
+
+        if (params or {}).get('order_fact_engine') == 'chunked':
+            with stage("load.Order_Fact", run_id, engine) as metrics:
+                chunks = fact_keys.resolve_chunks(chunked_order_fact(orders, order_item, customer, organization, product, street_code))
+                metrics.rows_in = order_item['rows']
+                metrics.rows_out, months = partition_load_chunks(engine, chunks, 'Order_Fact', warehouse_keys['Order_Fact'], partitioned_tables['Order_Fact'], workers=order_fact_copy_workers, types=KEY_COLUMN_TYPES)
+            logging.info("Order_Fact loaded successfully (chunked engine)")
+            return {'loaded': True, 'months': [month.isoformat() for month in months]}
 
         try:
-            orders_df = pd.read_json(StringIO(orders_json), orient='split')
-            order_item_df = pd.read_json(StringIO(order_item_json), orient='split')
-            customer_df = pd.read_json(StringIO(customer_json), orient='split')
-            organization_df = pd.read_json(StringIO(organization_json), orient='split')
-            product_df = pd.read_json(StringIO(product_json), orient='split')
-            street_code_df = pd.read_json(StringIO(street_code_json), orient='split')
-
-            print("orders_df columns:", orders_df.columns.tolist())
-            print("order_item_df columns:", order_item_df.columns.tolist())
-            print("customer_df columns:", customer_df.columns.tolist())
-            print("street_code_df columns:", street_code_df.columns.tolist())
-
-            if 'Order_ID' not in orders_df.columns:
-                logging.error("orders_df does not contain the expected column: 'Order_ID'")
-                raise ValueError("orders_df is missing the 'Order_ID' column")
-
-            if 'Order_ID' not in order_item_df.columns:
-                logging.error("order_item_df does not contain the expected column: 'Order_ID'")
-                raise ValueError("order_item_df is missing the 'Order_ID' column")
-
-            if 'Customer_ID' not in customer_df.columns:
-                logging.error("customer_df does not contain the expected column: 'Customer_ID'")
-                raise ValueError("customer_df is missing the 'Customer_ID' column")
-
-            if 'Street_ID' not in street_code_df.columns:
-                logging.error("street_code_df does not contain the expected column: 'Street_ID'")
-                raise ValueError("street_code_df is missing the 'Street_ID' column")
-
-            order_fact_df = pd.merge(orders_df, order_item_df, on='Order_ID')
-            order_fact_df = pd.merge(order_fact_df, customer_df, on='Customer_ID')
-            order_fact_df = pd.merge(order_fact_df, organization_df, on='Employee_ID')
-            order_fact_df = pd.merge(order_fact_df, product_df, on='Product_ID')
-
-            if 'Street_ID' in customer_df.columns:
-                order_fact_df['street_code'] = customer_df['Street_ID']
-            else:
-                logging.error("customer_df does not contain the expected column: 'Street_ID'")
-                raise ValueError("customer_df is missing the 'Street_ID' column")
-
-            order_fact_df = pd.merge(
-                order_fact_df,
-                street_code_df,
-                left_on='street_code',
-                right_on='Street_ID',
-                suffixes=('', '_street')
-            )
-
-            print("order_fact_df columns after merge:", order_fact_df.columns.tolist())
-
-            if 'Street_ID' not in order_fact_df.columns:
-                logging.error("Street_ID column is missing in order_fact_df after merge.")
-                raise ValueError("Street_ID column is missing in order_fact_df after merge.")
-
-            order_fact_df = order_fact_df.rename(columns={
-                'Customer_ID': 'Customer_ID',
-                'Employee_ID': 'Employee_ID',
-                'Street_ID': 'Street_ID',  
-                'Product_ID': 'Product_ID',
-                'Order_Date': 'Order_Date',
-                'Order_ID': 'Order_ID',
-                'Order_Type': 'Order_Type',
-                'Delivery_Date': 'Delivery_Date',
-                'Quantity': 'Quantity',
-                'Total_Retail_Price': 'Total_Retail_Price',
-                'CostPrice_Per_Unit': 'Costprice_Per_Unit',
-                'Discount': 'Discount'
-            })
-
-            order_fact_df = order_fact_df[['Customer_ID', 'Employee_ID', 'Street_ID', 'Product_ID', 'Order_Date', 'Order_ID', 'Order_Type', 'Delivery_Date', 'Quantity', 'Total_Retail_Price', 'Costprice_Per_Unit', 'Discount']]
-
-            postgres_hook = PostgresHook(postgres_conn_id=postgres_conn_id)
-            engine = create_engine(postgres_hook.get_uri())
-            order_fact_df.to_sql('Order_Fact', engine, if_exists='replace', index=False)
+            with stage("transform.Order_Fact", run_id, engine) as metrics:
+                columns = warehouse_inputs['Order_Fact']
+                orders_df = read_staged(orders, columns=columns['orders'])
+                order_item_df = read_staged(order_item, columns=columns['order_item'])
+                customer_df = read_staged(customer, columns=columns['customer'])
+                organization_df = read_staged(organization, columns=columns['organization'])
+                product_df = read_staged(product, columns=columns['product_list'])
+                street_code_df = read_staged(street_code, columns=columns['street_code'])
+
+                order_fact_df = fact_keys.resolve(build_order_fact(orders_df, order_item_df, customer_df, organization_df, product_df, street_code_df))
+                fact_keys.report()
+                metrics.rows_in, metrics.rows_out = order_item['rows'], len(order_fact_df)
+
+            # Incremental extracts only carry new orders; only their months are rebuilt
+            with stage("load.Order_Fact", run_id, engine) as metrics:
+                metrics.rows_in = len(order_fact_df)
+                metrics.rows_out, months = partition_load(engine, order_fact_df, 'Order_Fact', warehouse_keys['Order_Fact'], partitioned_tables['Order_Fact'], workers=order_fact_copy_workers, types=KEY_COLUMN_TYPES)
             logging.info("Order_Fact loaded successfully")
+            return {'loaded': True, 'months': [month.isoformat() for month in months]}
 
         except Exception as e:
             logging.error(f"Error transforming and loading Order_Fact: {e}")
@@ -197,176 +282,171 @@ with DAG(
             
             
         
-    @task(task_id='transform_and_load_product_dim')
-    def transform_and_load_product_dim(product_list_json, product_level_json, supplier_json):
-        """
-        Transforms and loads data into the Product_Dim table in PostgreSQL.
-        """
-        if product_list_json is None or product_level_json is None or supplier_json is None:
-            return
-        try:
-            product_list_df = pd.read_json(StringIO(product_list_json), orient='split')
-            product_level_df = pd.read_json(StringIO(product_level_json), orient='split')
-            supplier_df = pd.read_json(StringIO(supplier_json), orient='split')[['Supplier_ID', 'Supplier_Name', 'Country']] 
-
-            product_dim_df = pd.merge(product_list_df, product_level_df, left_on='Product_Level', right_on='Product_Level')
-            product_dim_df = pd.merge(product_dim_df, supplier_df, left_on='Supplier_ID', right_on='Supplier_ID')  
-
-            product_dim_df = product_dim_df.rename(columns={
-                'Product_ID': 'Product_ID',
-                'Product_Name': 'Product_Name',
-                'Supplier_ID': 'Supplier_ID',
-                'Product_Level': 'Product_Level',
-                'Product_Ref_ID': 'Product_Ref_ID',
-                'Supplier_Name': 'Supplier_Name', 
-                'Country': 'Supplier_Country'  
-            })
-
-            product_dim_df = product_dim_df[['Product_ID', 'Product_Name', 'Supplier_ID', 'Product_Level', 'Product_Ref_ID', 'Supplier_Country', 'Supplier_Name']]
-
-            postgres_hook = PostgresHook(postgres_conn_id=postgres_conn_id)
-            engine = create_engine(postgres_hook.get_uri())
-            product_dim_df.to_sql('Product_Dim', engine, if_exists='replace', index=False)
-            print("Product_Dim loaded successfully")
-        except Exception as e:
-            print(f"Error transforming and loading Product_Dim: {e}")
-            
-            
-            
-    @task(task_id='transform_and_load_geography_dim')
-    def transform_and_load_geography_dim(street_code_json, city_json, continent_json, country_json, state_json):
+    @task(task_id='transform_and_load_geography_dim', pool=postgres_warehouse_pool)
+    def transform_and_load_geography_dim(street_code, city, continent, country, run_id=None):
         """
         Transforms and loads data into the Geography_Dim table in PostgreSQL.
         """
-        if street_code_json is None or city_json is None or continent_json is None or country_json is None or state_json is None:
-            logging.warning("One or more input JSONs are None. Skipping transformation and load.")
-            return
+        from bi_etl.connections import postgres_engine
+        from bi_etl.fingerprints import unchanged
+        from bi_etl.geography import GeographyLookups, drop_state_columns, lookups_fingerprint
+        from bi_etl.metrics import stage
+        from bi_etl.staging import STAGING_DIR, read_staged
+        from bi_etl.surrogate_keys import load_dimension
+        from bi_etl.transforms import build_geography_dim
+
+        if street_code is None or city is None or continent is None or country is None:
+            logging.warning("One or more staged inputs are None. Skipping transformation and load.")
+            return {'loaded': False}
+        # The lookups are rebuilt only when city, continent or country changed
+        lookup_dir = os.path.join(STAGING_DIR, 'geography')
+        fingerprint = lookups_fingerprint(city, continent, country)
+        lookups = GeographyLookups.load(lookup_dir, fingerprint)
+        if unchanged(street_code, city, continent, country) and lookups is not None:
+            logging.info("Geography_Dim inputs unchanged; skipping")
+            return {'loaded': True}
 
         try:
-            street_code_df = pd.read_json(StringIO(street_code_json), orient='split')
-            city_df = pd.read_json(StringIO(city_json), orient='split')
-            continent_df = pd.read_json(StringIO(continent_json), orient='split')
-            country_df = pd.read_json(StringIO(country_json), orient='split')
-            state_df = pd.read_json(StringIO(state_json), orient='split')
-
-            # Debug
-            print("street_code_df columns:", street_code_df.columns.tolist())
-            print("city_df columns:", city_df.columns.tolist())
-            print("country_df columns:", country_df.columns.tolist())
-            print("state_df columns:", state_df.columns.tolist())
-
-            # Verify the columns in city_df
-            if not all(col in city_df.columns for col in ['City_ID', 'City_Name', 'Country']):
-                logging.error("city_df does not contain the expected columns: 'City_ID', 'City_Name', 'Country'")
-                return
-
-            # Verify the columns in continent_df
-            if not all(col in continent_df.columns for col in ['Continent_ID', 'Continent_Name']):
-                logging.error("continent_df does not contain the expected columns: 'Continent_ID', 'Continent_Name'")
-                return
-
-            # Verify the columns in street_code_df
-            if not all(col in street_code_df.columns for col in ['Street_ID', 'Country', 'Street_Name', 'City_ID', 'Postal_Code']):
-                logging.error("street_code_df does not contain the expected columns: 'Street_ID', 'Country', 'Street_Name', 'City_ID', 'Postal_Code'")
-                return
-
-            # Verify the columns in country_df
-            if not all(col in country_df.columns for col in ['Country', 'Country_ID', 'Continent_ID']):
-                logging.error("country_df does not contain the expected columns: 'Country', 'Country_ID', 'Continent_ID'")
-                return
-
-            # Verify the columns in state_df
-            if not all(col in state_df.columns for col in ['State_ID', 'State_Type', 'State_Code', 'State_Name', 'Country']):
-                logging.error("state_df does not contain the expected columns: 'State_ID', 'State_Type', 'State_Code', 'State_Name', 'Country'")
-                return
-
-            # Select specific columns
-            city_df = city_df[['City_ID', 'City_Name', 'Country']]
-            continent_df = continent_df[['Continent_ID', 'Continent_Name']]
-            street_code_df = street_code_df[['Street_ID', 'Country', 'Street_Name', 'City_ID', 'Postal_Code']]
-            country_df = country_df[['Country', 'Country_ID', 'Continent_ID']] 
-            state_df = state_df[['State_ID', 'State_Code', 'State_Name', 'Country']]
-
-            # Create a mapping between Country (codes) and Country_ID (numeric IDs)
-            country_mapping = country_df.set_index('Country')['Country_ID'].to_dict()
-
-            # Debug: Print the country mapping
-            print("Country mapping:", country_mapping)
-
-            street_code_df['Country_ID'] = street_code_df['Country'].map(country_mapping)
-            state_df['Country_ID'] = state_df['Country'].map(country_mapping)
-
-            print("Unique values in street_code_df['Country_ID']:", street_code_df['Country_ID'].unique())
-            print("Unique values in state_df['Country_ID']:", state_df['Country_ID'].unique())
-
-            # Rename the 'Country' column in each DataFrame to avoid conflicts during merge
-            street_code_df = street_code_df.rename(columns={'Country': 'Street_Country'})
-            city_df = city_df.rename(columns={'Country': 'City_Country'})
-            state_df = state_df.rename(columns={'Country': 'State_Country'})
-
-            # Merge DataFrames
-            geo_dim_df = pd.merge(street_code_df, city_df, left_on='City_ID', right_on='City_ID')
-            geo_dim_df = pd.merge(geo_dim_df, country_df, left_on='Country_ID', right_on='Country_ID')  # Merge using Country_ID
-            geo_dim_df = pd.merge(geo_dim_df, continent_df, left_on='Continent_ID', right_on='Continent_ID')  # Merge using Continent_ID
-            geo_dim_df = pd.merge(geo_dim_df, state_df, left_on='Country_ID', right_on='Country_ID')  # Merge using Country_ID
-
-            # Rename columns
-            geo_dim_df = geo_dim_df.rename(columns={
-                'Street_ID': 'Street_ID',
-                'Continent_Name': 'Continent',
-                'City_Name': 'City',
-                'Street_Name': 'Street_Name',
-                'Postal_Code': 'Postal_Code',
-                'Country_Name': 'Country',
-                'State_Name': 'State',
-                'State_Code': 'State_Code',
-                'State_ID': 'State_ID'
-            })
-
-            # Select final columns
-            geo_dim_df = geo_dim_df[['Street_ID', 'Continent', 'Country', 'State_ID', 'State_Code', 'State', 'Postal_Code', 'City', 'Street_Name']]
+            engine = postgres_engine(postgres_conn_id)
+            with stage("transform.Geography_Dim", run_id, engine) as metrics:
+                columns = warehouse_inputs['Geography_Dim']
+                if lookups is None:
+                    lookups = GeographyLookups.build(
+                        read_staged(city, columns=columns['city']),
+                        read_staged(continent, columns=columns['continent']),
+                        read_staged(country, columns=columns['country']),
+                    )
+                    lookups.save(lookup_dir, fingerprint)
+                street_code_df = read_staged(street_code, columns=columns['street_code'])
+                geo_dim_df = build_geography_dim(street_code_df, lookups)
+                metrics.rows_in, metrics.rows_out = street_code['rows'], len(geo_dim_df)
 
             # Load data into PostgreSQL
-            postgres_hook = PostgresHook(postgres_conn_id=postgres_conn_id)
-            engine = create_engine(postgres_hook.get_uri())
-            geo_dim_df.to_sql('Geography_Dim', engine, if_exists='replace', index=False)
+            with stage("load.Geography_Dim", run_id, engine) as metrics:
+                metrics.rows_in = len(geo_dim_df)
+                drop_state_columns(engine)
+                metrics.rows_out = load_dimension(engine, geo_dim_df, 'Geography_Dim', warehouse_keys['Geography_Dim'], STAGING_DIR)
             logging.info("Geography_Dim loaded successfully")
+            return {'loaded': True}
 
         except Exception as e:
             logging.error(f"Error transforming and loading Geography_Dim: {e}")
+            raise
         
     
 
-    @task(task_id='transform_and_load_time_dim')
-    def transform_and_load_time_dim():
+    @task(task_id='transform_and_load_time_dim', pool=postgres_warehouse_pool)
+    def transform_and_load_time_dim(run_id=None):
         """
-        Generates and loads data into the Time_Dim table in PostgreSQL.
+        Extends the Time_Dim table in PostgreSQL to cover the order dates in the source.
+
+        Only the dates missing from the table are generated and appended.
+        """
+        import pandas as pd
+        from sqlalchemy import inspect, text
+        from bi_etl.connections import mysql_engine, postgres_engine
+        from bi_etl.load import merge_load
+        from bi_etl.metrics import stage
+        from bi_etl.time_dim import build_time_dim, missing_date_ranges
+
+        with mysql_engine(mysql_conn_id).connect() as conn:
+            first_date, last_date = conn.execute(text(
+                "SELECT MIN(Order_Date), GREATEST(MAX(Order_Date), COALESCE(MAX(Delivery_Date), MAX(Order_Date))) FROM orders"
+            )).one()
+        if first_date is None:
+            print("No orders found; Time_Dim left unchanged")
+            return
+
+        engine = postgres_engine(postgres_conn_id)
+        loaded_start = loaded_end = None
+        if inspect(engine).has_table('Time_Dim'):
+            with engine.connect() as conn:
+                loaded_start, loaded_end = conn.execute(text('SELECT MIN("Date_ID"), MAX("Date_ID") FROM "Time_Dim"')).one()
+
+        ranges = missing_date_ranges(first_date, last_date, loaded_start, loaded_end)
+        if not ranges:
+            print(f"Time_Dim already covers {loaded_start:%Y-%m-%d}..{loaded_end:%Y-%m-%d}")
+            return
+        with stage("transform.Time_Dim", run_id, engine) as metrics:
+            time_dim_df = pd.concat([build_time_dim(start, end) for start, end in ranges], ignore_index=True)
+            metrics.rows_out = len(time_dim_df)
+        with stage("load.Time_Dim", run_id, engine) as metrics:
+            metrics.rows_in = len(time_dim_df)
+            metrics.rows_out = merge_load(engine, time_dim_df, 'Time_Dim', warehouse_keys['Time_Dim'])
+        print(f"Time_Dim loaded: {len(time_dim_df)} new dates")
+
+    @task(task_id='refresh_rollups', pool=postgres_warehouse_pool)
+    def refresh_sales_rollups(order_fact, dimensions, run_id=None):
+        """
+        Refreshes the sales rollup tables for the Order_Fact months loaded by this run.
+
+        ``dimensions`` maps each dimension the rollups join to its staged inputs. Rollups joining a
+        dimension are rebuilt in full when that dimension was reloaded.
+        """
+        from bi_etl.connections import postgres_engine
+        from bi_etl.fingerprints import unchanged
+        from bi_etl.metrics import stage
+        from bi_etl.rollups import refresh_rollups
+
+        months = [date.fromisoformat(month) for month in (order_fact or {}).get('months', [])]
+        changed_dimensions = [
+            table for table, handles in dimensions.items()
+            if None not in handles and not unchanged(*handles)
+        ]
+
+        engine = postgres_engine(postgres_conn_id)
+        with stage("rollups", run_id, engine) as metrics:
+            written = refresh_rollups(engine, months, changed_dimensions)
+            metrics.rows_out = sum(written.values())
+        logging.info(f"Rollups refreshed: {written}")
+
+    @task(task_id='commit_extract_state')
+    def commit_extract_state(handles, loads):
         """
-        start_date = datetime(2020, 1, 1)
-        end_date = datetime(2025, 12, 31)
-        date_range = pd.date_range(start=start_date, end=end_date)
-        time_dim_df = pd.DataFrame(date_range, columns=['Date_ID'])
-        time_dim_df['Year_ID'] = time_dim_df['Date_ID'].dt.year.astype(str)
-        time_dim_df['Quarter'] = time_dim_df['Date_ID'].dt.quarter.apply(lambda x: f"Q{x}")
-        time_dim_df['Month_Name'] = time_dim_df['Date_ID'].dt.strftime('%B')
-        time_dim_df['Weekday_Name'] = time_dim_df['Date_ID'].dt.strftime('%A')
-        time_dim_df['Month_Num'] = time_dim_df['Date_ID'].dt.month
-        time_dim_df['Weekday_Num'] = time_dim_df['Date_ID'].dt.weekday
-        postgres_hook = PostgresHook(postgres_conn_id=postgres_conn_id)
-        engine = create_engine(postgres_hook.get_uri())
-        time_dim_df.to_sql('Time_Dim', engine, if_exists='replace', index=False)
-        print("Time_Dim loaded")
+        Stores the watermarks and fingerprints of this run's extracts once every load has succeeded.
+
+        ``loads`` maps each warehouse table to what its task returned. A source table's state is only
+        committed when every warehouse table built from it reports that it loaded (or was already up to
+        date): a load skipped for a missing sibling input would otherwise leave that table's changes, or
+        the orders behind the watermark, unloaded for good.
+        """
+        from bi_etl.fingerprints import commit_fingerprints
+        from bi_etl.watermarks import aligned_watermarks, commit_watermarks
+
+        not_loaded = [table for table, load in loads.items() if not (load or {}).get('loaded')]
+        pending = {source for table in not_loaded for source in warehouse_inputs[table]}
+        if not_loaded:
+            logging.warning(f"{not_loaded} not loaded. Keeping the previous state of {sorted(pending)}.")
+        extracted = [handle for handle in handles if handle is not None and handle['table'] not in pending]
+        commit_fingerprints(extracted)
+
+        incremental = [handle for handle in extracted if handle['table'] in incremental_tables]
+        if len(incremental) < len(incremental_tables):
+            logging.warning("An incremental extract failed or was not loaded. Keeping the previous watermarks.")
+            return
+        # orders and order_item are committed at the lower of their two watermarks: items inserted
+        # between the two extracts are extracted again with their order next run
+        commit_watermarks(aligned_watermarks(incremental, incremental_tables))
 
     # Task Dependencies
-    customer_task = transform_and_load_customer_dim(extracted_data['customer'])
-    org_task = transform_and_load_organization_dim(extracted_data['organization'])
-    order_task = transform_and_load_order_fact(extracted_data['orders'], extracted_data['order_item'], extracted_data['customer'], extracted_data['organization'], extracted_data['product_list'], extracted_data['street_code'])
-    product_task = transform_and_load_product_dim(extracted_data['product_list'], extracted_data['product_level'], extracted_data['supplier'])
-    geo_task = transform_and_load_geography_dim(extracted_data['street_code'], extracted_data['city'], extracted_data['continent'], extracted_data['country'], extracted_data['state'])
+    dimension_tasks = {
+        table: dimension_task(table, definition)([extracted_data[source] for source in definition['inputs']])
+        for table, definition in plain_dimensions.items()
+    }
+    order_task = transform_and_load_order_fact(*(extracted_data[source] for source in warehouse_inputs['Order_Fact']))
+    geo_task = transform_and_load_geography_dim(*(extracted_data[source] for source in warehouse_inputs['Geography_Dim']))
     time_task = transform_and_load_time_dim()
-
-    
-    customer_task >> org_task >> order_task
-    product_task >> order_task
-    geo_task >> order_task
-    order_task >> time_task 
\ No newline at end of file
+    rollup_task = refresh_sales_rollups(order_task, {
+        table: [extracted_data[source] for source in warehouse_inputs[table]] for table in rollup_dimensions
+    })
+    state_task = commit_extract_state(
+        [extracted_data[table] for table in tables_mysql_source],
+        {**dimension_tasks, 'Order_Fact': order_task, 'Geography_Dim': geo_task},
+    )
+
+    # The dimensions and Time_Dim load in parallel. Order_Fact resolves the dimensions' surrogate keys,
+    # so it waits for them, and the rollups aggregate Order_Fact joined to Customer_Dim, Product_Dim and
+    # Geography_Dim.
+    [*dimension_tasks.values(), geo_task] >> order_task
+    [dimension_tasks['Customer_Dim'], dimension_tasks['Product_Dim'], geo_task] >> rollup_task
+    [*dimension_tasks.values(), order_task, geo_task, rollup_task] >> state_task
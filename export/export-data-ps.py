@@ -1,6 +1,19 @@
+import argparse
+import gzip
+import hashlib
+import json
 import psycopg2
-import pandas as pd
 import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from sqlalchemy import create_engine
+
+# Share the pipeline's metrics module with the DAG
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dags"))
+from bi_etl.metrics import RUN_SUMMARY_TABLE, increment, stage
 
 # PostgreSQL connection details
 POSTGRES_HOST = "localhost"
@@ -9,27 +22,57 @@ POSTGRES_DB = "postgres"
 POSTGRES_USER = "essalhi"
 POSTGRES_PASSWORD = "essalhi"
 
-# Directory for storing CSV files
+# Directory for storing the exported files and the manifest of finished chunks
 OUTPUT_DIR = "postgres_tables_csv"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+MANIFEST_FILE = "manifest.json"
 
 # List of tables to export
 TABLES_TO_EXPORT = [
-    "Customer_Dim",      
-    "Organization_Dim", 
-    "Product_Dim",  
+    "Customer_Dim",
+    "Organization_Dim",
+    "Product_Dim",
     "Order_Fact",
     "Geography_Dim",
     "Time_Dim"
 ]
 
+# Integer key used to split a table into chunks of about CHUNK_ROWS rows.
+# Tables without a key, or smaller than CHUNK_ROWS, are exported as one file.
+SPLIT_KEYS = {
+    "Customer_Dim": "Customer_ID",
+    "Organization_Dim": "Employee_ID",
+    "Product_Dim": "Product_ID",
+    "Order_Fact": "Order_ID",
+    "Geography_Dim": "Street_ID",
+}
+CHUNK_ROWS = 1_000_000
+
+# Chunks exported in parallel; each worker uses its own connection
+WORKERS = 4
+
+# Output formats and their file extensions
+FORMATS = {"csv": ".csv", "csv.gz": ".csv.gz", "csv.zst": ".csv.zst", "parquet": ".parquet"}
+
+# Rows fetched per round-trip, and written per row group, for Parquet output
+PARQUET_BATCH_ROWS = 100_000
+
+def connect():
+    """Open a connection to the warehouse."""
+    return psycopg2.connect(
+        host=POSTGRES_HOST,
+        port=POSTGRES_PORT,
+        dbname=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD
+    )
+
 def table_exists(conn, table_name):
     """Check if a table exists in the PostgreSQL database."""
     try:
         with conn.cursor() as cursor:
             query = """
             SELECT EXISTS (
-                SELECT 1 FROM information_schema.tables 
+                SELECT 1 FROM information_schema.tables
                 WHERE table_name = %s
                 AND table_schema = 'public'
             );
@@ -40,41 +83,329 @@ def table_exists(conn, table_name):
         print(f"Error checking if table {table_name} exists: {e}")
         return False
 
-def export_table_to_csv(table_name, output_dir, chunksize=10000):
-    """Export a PostgreSQL table to a CSV file in chunks to avoid memory issues."""
+# pg_class rows holding a table's data: the table itself, or the leaf partitions of a partitioned one.
+# pg_partition_tree returns nothing for a plain table, hence the first condition.
+TABLE_STORAGE = (
+    "c.relkind <> 'p' AND (c.oid = to_regclass(%(table)s) "
+    "OR c.oid IN (SELECT relid FROM pg_partition_tree(to_regclass(%(table)s)) WHERE isleaf))"
+)
+
+def key_ranges(conn, table_name, chunk_rows):
+    """Split a table into key ranges of about chunk_rows rows each.
+
+    Returns a list of [lower, upper) bounds, where None is unbounded. The first
+    range also holds the rows whose key is NULL.
+    """
+    key = SPLIT_KEYS.get(table_name)
+    if key is None:
+        return [[None, None]]
+    with conn.cursor() as cursor:
+        # The planner's estimate is enough to size the chunks and avoids a count(*). A partitioned
+        # table (Order_Fact) has no estimate of its own, so sum those of its partitions.
+        cursor.execute(
+            f"SELECT coalesce(sum(greatest(reltuples, 0)), 0)::bigint FROM pg_class c WHERE {TABLE_STORAGE}",
+            {"table": f'"{table_name}"'},
+        )
+        estimate = cursor.fetchone()[0] or 0
+        if estimate <= chunk_rows:
+            return [[None, None]]
+        parts = -(-estimate // chunk_rows)
+        cursor.execute(
+            f'SELECT percentile_disc(%s) WITHIN GROUP (ORDER BY "{key}") FROM "{table_name}"',
+            ([i / parts for i in range(1, parts)],),
+        )
+        bounds = sorted(set(bound for bound in cursor.fetchone()[0] or [] if bound is not None))
+    edges = [None, *bounds, None]
+    return [[edges[i], edges[i + 1]] for i in range(len(edges) - 1)]
+
+def table_version(conn, table_name):
+    """Data version of a table: changes when the pipeline loads it, rows are written or partitions swapped.
+
+    Combines the start of the table's latest load stage in the run summary, the rows inserted, updated
+    and deleted in every partition (pg_stat_user_tables, which lag writes by up to a second) and the
+    partitions' files, which a TRUNCATE or a partition swap replaces. A resumed export only keeps the
+    chunks of a table whose version has not moved since they were written.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT coalesce(sum(s.n_tup_ins + s.n_tup_upd + s.n_tup_del), 0)::bigint, "
+            "       array_agg(c.relfilenode::bigint ORDER BY c.oid) "
+            f"FROM pg_class c LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid WHERE {TABLE_STORAGE}",
+            {"table": f'"{table_name}"'},
+        )
+        changes, files = cursor.fetchone()
+        loaded_at = None
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (RUN_SUMMARY_TABLE,))
+        if cursor.fetchone()[0]:
+            cursor.execute(f"SELECT max(started_at) FROM {RUN_SUMMARY_TABLE} WHERE stage = %s", (f"load.{table_name}",))
+            loaded_at = cursor.fetchone()[0]
+    return f"{loaded_at.isoformat() if loaded_at else ''}:{changes}:{','.join(str(file) for file in files or [])}"
+
+def chunk_query(table_name, bounds):
+    """SELECT statement for the rows of a table in one key range."""
+    lower, upper = bounds
+    key = SPLIT_KEYS.get(table_name)
+    query = f'SELECT * FROM "{table_name}"'
+    if lower is None and upper is None:
+        return query
+    if lower is None:
+        return f'{query} WHERE "{key}" < {int(upper)} OR "{key}" IS NULL'
+    if upper is None:
+        return f'{query} WHERE "{key}" >= {int(lower)}'
+    return f'{query} WHERE "{key}" >= {int(lower)} AND "{key}" < {int(upper)}'
+
+def open_csv_output(path, fmt):
+    """Open a text file for CSV output, compressed according to fmt."""
+    if fmt == "csv.gz":
+        return gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6)
+    if fmt == "csv.zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("csv.zst output needs the zstandard package (pip install zstandard)")
+        return zstandard.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+def write_csv(conn, query, path, fmt):
+    """Stream the rows of query to a CSV file with COPY ... TO STDOUT. Returns the row count."""
+    with open_csv_output(path, fmt) as f:
+        with conn.cursor() as cursor:
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            rows = cursor.rowcount
+    increment("round_trips")
+    return rows
+
+def arrow_type(pa, data_type, precision=None, scale=None):
+    """Arrow type for a PostgreSQL column type; anything unlisted is exported as a string.
+
+    NUMERIC(p, s) keeps its precision as an Arrow decimal. An unconstrained NUMERIC has no fixed
+    scale to map to, so it is exported as float64.
+    """
+    if data_type == "numeric" and precision is not None:
+        return pa.decimal128(precision, scale or 0) if precision <= 38 else pa.decimal256(precision, scale or 0)
+    types = {
+        "bigint": pa.int64(), "integer": pa.int32(), "smallint": pa.int16(),
+        "double precision": pa.float64(), "real": pa.float32(), "numeric": pa.float64(),
+        "boolean": pa.bool_(), "date": pa.date32(),
+        "timestamp without time zone": pa.timestamp("us"),
+        "timestamp with time zone": pa.timestamp("us", tz="UTC"),
+    }
+    return types.get(data_type, pa.string())
+
+def arrow_column(pa, values, arrow_type):
+    """Arrow array of one column of fetched rows. psycopg2 returns NUMERIC as Decimal, which Arrow
+    does not convert to a float type by itself."""
+    if pa.types.is_floating(arrow_type):
+        values = [None if value is None else float(value) for value in values]
+    return pa.array(values, type=arrow_type)
+
+def write_parquet(conn, table_name, query, path):
+    """Write the rows of query to a Parquet file through a server-side cursor. Returns the row count."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT column_name, data_type, numeric_precision, numeric_scale FROM information_schema.columns "
+            "WHERE table_schema = 'public' AND table_name = %s ORDER BY ordinal_position",
+            (table_name,),
+        )
+        schema = pa.schema([(name, arrow_type(pa, *column)) for name, *column in cursor.fetchall()])
+
+    rows = 0
+    with conn.cursor(name="export") as cursor:
+        cursor.itersize = PARQUET_BATCH_ROWS
+        cursor.execute(query)
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            while True:
+                batch = cursor.fetchmany(PARQUET_BATCH_ROWS)
+                increment("round_trips")
+                if not batch:
+                    break
+                columns = list(zip(*batch))
+                writer.write_table(pa.Table.from_arrays(
+                    [arrow_column(pa, columns[i], field.type) for i, field in enumerate(schema)], schema=schema
+                ))
+                rows += len(batch)
+    return rows
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class Manifest:
+    """Key ranges and finished chunks of an export, saved after every chunk so that a rerun can resume.
+
+    Only an incomplete export is resumed: once every chunk has been written the manifest is marked
+    complete, and the next export starts a new one.
+    """
+
+    def __init__(self, output_dir, fmt, resume=True):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_FILE)
+        self.lock = threading.Lock()
+        self.data = {"format": fmt, "complete": False, "tables": {}}
+        if resume and os.path.exists(self.path):
+            with open(self.path) as f:
+                saved = json.load(f)
+            if saved.get("complete"):
+                print(f"ℹ️ The last export in {output_dir} completed; exporting everything again")
+            elif saved.get("format") != fmt:
+                print(f"⚠️ {self.path} is for {saved.get('format')} output; exporting everything again")
+            else:
+                self.data = saved
+
+    def ranges(self, table_name, version):
+        """Key ranges of an interrupted export of the table, or None if there is none for this data version."""
+        table = self.data["tables"].get(table_name)
+        if table is None:
+            return None
+        if table.get("version") != version:
+            print(f"⚠️ {table_name} changed since the interrupted export; exporting it again")
+            with self.lock:
+                del self.data["tables"][table_name]
+            return None
+        return table["ranges"]
+
+    def start_table(self, table_name, ranges, version):
+        with self.lock:
+            self.data["tables"].setdefault(table_name, {"version": version, "ranges": ranges, "chunks": {}})
+            self.save()
+
+    def complete(self):
+        with self.lock:
+            self.data["complete"] = True
+            self.save()
+
+    def is_done(self, table_name, index):
+        """True if the chunk was finished and its file still matches the recorded checksum."""
+        chunk = self.data["tables"][table_name]["chunks"].get(str(index))
+        if chunk is None:
+            return False
+        path = os.path.join(self.output_dir, chunk["file"])
+        return os.path.exists(path) and file_sha256(path) == chunk["sha256"]
+
+    def finish_chunk(self, table_name, index, record):
+        with self.lock:
+            self.data["tables"][table_name]["chunks"][str(index)] = record
+            self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+def chunk_file(table_name, index, parts, fmt):
+    """File of a chunk relative to the output directory: <table>.<ext>, or <table>/part-NNNNN.<ext> when split."""
+    if parts == 1:
+        return f"{table_name}{FORMATS[fmt]}"
+    return os.path.join(table_name, f"part-{index:05d}{FORMATS[fmt]}")
+
+def export_chunk(table_name, index, bounds, parts, fmt, manifest):
+    """Export one key range of a table to its own file and record it in the manifest."""
+    relative_path = chunk_file(table_name, index, parts, fmt)
+    path = os.path.join(manifest.output_dir, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    query = chunk_query(table_name, bounds)
+
+    start_time = time.monotonic()
+    conn = connect()
     try:
-        with psycopg2.connect(
-            host=POSTGRES_HOST,
-            port=POSTGRES_PORT,
-            dbname=POSTGRES_DB,
-            user=POSTGRES_USER,
-            password=POSTGRES_PASSWORD
-        ) as conn:
+        if fmt == "parquet":
+            rows = write_parquet(conn, table_name, query, tmp_path)
+        else:
+            rows = write_csv(conn, query, tmp_path, fmt)
+    finally:
+        conn.close()
+    # Only complete files get their final name, so a crash never leaves a truncated chunk behind
+    os.replace(tmp_path, path)
+    elapsed = time.monotonic() - start_time
 
-            if not table_exists(conn, table_name):
-                print(f"❌ Table {table_name} does not exist in the database.")
-                return
+    size = os.path.getsize(path)
+    increment("bytes", size)
+    record = {"file": relative_path, "bounds": bounds, "rows": rows, "bytes": size, "sha256": file_sha256(path)}
+    manifest.finish_chunk(table_name, index, record)
+
+    rate = rows / elapsed if elapsed > 0 else 0
+    print(f"✅ Exported {table_name} [{index + 1}/{parts}] to {path}: {rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return record
 
-            query = f'SELECT * FROM "{table_name}";'
+def export_tables(tables, output_dir, fmt="csv", workers=WORKERS, chunk_rows=CHUNK_ROWS, resume=True,
+                  run_id=None, summary_engine=None):
+    """Export tables in parallel chunks, resuming from the manifest in output_dir.
 
-            csv_file_path = os.path.join(output_dir, f"{table_name}.csv")
+    Chunks finished by an interrupted run are skipped while their files match the
+    manifest's checksums and their table's data version is unchanged. Returns {table: rows exported by this run}. The export
+    is measured as stage export, stored in the run summary when summary_engine is given.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(output_dir, fmt, resume)
 
-            # Use chunksize to read data in batches
-            with open(csv_file_path, 'w', newline='', encoding='utf-8') as f:
-                first_chunk = True
-                for chunk in pd.read_sql_query(query, conn, chunksize=chunksize):
-                    chunk.to_csv(f, index=False, header=first_chunk)
-                    first_chunk = False  # Write header only for the first chunk
+    chunks = []
+    conn = connect()
+    try:
+        for table_name in tables:
+            if not table_exists(conn, table_name):
+                print(f"❌ Table {table_name} does not exist in the database.")
+                continue
+            # A resumed export keeps the key ranges of the first attempt, if the data did not change since
+            version = table_version(conn, table_name)
+            ranges = manifest.ranges(table_name, version) or key_ranges(conn, table_name, chunk_rows)
+            manifest.start_table(table_name, ranges, version)
+            for index, bounds in enumerate(ranges):
+                if manifest.is_done(table_name, index):
+                    print(f"⏭️ {table_name} [{index + 1}/{len(ranges)}] already exported")
+                    continue
+                chunks.append((table_name, index, bounds, len(ranges)))
+    finally:
+        conn.close()
 
-            print(f"✅ Exported {table_name} to {csv_file_path}")
+    exported = {table_name: 0 for table_name in tables}
+    failed = []
+    with stage("export", run_id, summary_engine) as metrics:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(export_chunk, table_name, index, bounds, parts, fmt, manifest): (table_name, index)
+                for table_name, index, bounds, parts in chunks
+            }
+            for future in as_completed(futures):
+                table_name, index = futures[future]
+                try:
+                    exported[table_name] += future.result()["rows"]
+                except Exception as e:
+                    failed.append(f"{table_name}[{index}]")
+                    print(f"Error exporting table {table_name} chunk {index}: {e}")
+        metrics.rows_in = metrics.rows_out = sum(exported.values())
 
-    except Exception as e:
-        print(f"Error exporting table {table_name}: {e}")
+    if failed:
+        print(f"❌ Export incomplete, failed chunks: {', '.join(sorted(failed))}. Run again to resume.")
+    else:
+        manifest.complete()
+    return exported
 
 def main():
-    """Export all specified tables to CSV files."""
-    for table_name in TABLES_TO_EXPORT:
-        export_table_to_csv(table_name, OUTPUT_DIR)
+    """Export all specified tables."""
+    parser = argparse.ArgumentParser(description="Export the warehouse tables.")
+    parser.add_argument("tables", nargs="*", default=TABLES_TO_EXPORT, help="tables to export (default: all)")
+    parser.add_argument("--format", choices=list(FORMATS), default="csv", help="output format (default: csv)")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help=f"output directory (default: {OUTPUT_DIR})")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"chunks exported in parallel (default: {WORKERS})")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                        help=f"approximate rows per file of a split table (default: {CHUNK_ROWS})")
+    parser.add_argument("--restart", action="store_true", help="ignore the manifest and export every chunk again")
+    args = parser.parse_args()
+
+    run_id = f"export__{datetime.now(timezone.utc).isoformat(timespec='seconds')}"
+    summary_engine = create_engine(
+        f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    )
+    export_tables(args.tables, args.output_dir, args.format, args.workers, args.chunk_rows,
+                  resume=not args.restart, run_id=run_id, summary_engine=summary_engine)
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,23 @@
+import argparse
+import re
 import subprocess
+import sys
 import pandas as pd
-import mysql.connector
 from mysql.connector import Error
+from mysql.connector.pooling import MySQLConnectionPool
 import logging
-from io import StringIO  # Add this import
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL
+
+# Reuse the DAG's bi_etl helpers: dtype plans for the parsed chunks and stage metrics
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dags"))
+from bi_etl.dtypes import DtypePlanner, whole_floats_to_int
+from bi_etl.metrics import increment, stage
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -17,17 +31,60 @@ mysql_config = {
     "user": "essalhi",
     "password": "essalhi",
     "database": "bi",
-    "port": "3307"
+    "port": "3307",
+    "allow_local_infile": True
+}
+
+# Bulk insert settings
+BATCH_SIZE = 5000       # rows per multi-row INSERT (or LOAD DATA file)
+COMMIT_SIZE = 50000     # rows parsed from mdb-export at a time; each chunk is one transaction
+USE_LOAD_DATA = False   # use LOAD DATA LOCAL INFILE instead of INSERT (needs local_infile=ON on the server)
+
+# Access / mdb-schema column types and the MySQL types they are created as.
+# Types listed with a size keep the size from the schema, e.g. "Text (30)" -> VARCHAR(30).
+MYSQL_TYPES = {
+    # mdb-schema "mysql" backend names
+    "int": "INT", "integer": "INT", "smallint": "SMALLINT", "tinyint": "TINYINT", "bigint": "BIGINT",
+    "float": "DOUBLE", "double": "DOUBLE", "real": "FLOAT",
+    "numeric": "DECIMAL", "decimal": "DECIMAL",
+    "date": "DATE", "datetime": "DATETIME", "timestamp": "DATETIME",
+    "char": "CHAR", "varchar": "VARCHAR", "text": "TEXT", "mediumtext": "MEDIUMTEXT", "longtext": "LONGTEXT",
+    "boolean": "TINYINT(1)", "bool": "TINYINT(1)", "bit": "TINYINT(1)",
+    "blob": "LONGBLOB", "longblob": "LONGBLOB", "varbinary": "LONGBLOB",
+    # Access type names
+    "byte": "TINYINT UNSIGNED", "long integer": "INT", "single": "FLOAT",
+    "currency": "DECIMAL(19,4)", "yes/no": "TINYINT(1)", "memo/hyperlink": "LONGTEXT",
+    "ole": "LONGBLOB", "replication id": "CHAR(38)",
 }
+SIZED_TYPES = {"CHAR", "VARCHAR", "DECIMAL", "TEXT"}
+
+# Tables imported in parallel; each worker holds one pooled MySQL connection
+WORKERS = 4
+
+# Control table recording how far each table's import got. It is updated in the
+# same transaction as each chunk of rows, so a rerun resumes after the last
+# committed chunk and skips the tables that finished.
+LEDGER_TABLE = "import_progress"
+
+class CountingReader:
+    """Wrap a binary stream and count the bytes read through it."""
 
-# Connect to MySQL
-try:
-    mysql_conn = mysql.connector.connect(**mysql_config)
-    mysql_cursor = mysql_conn.cursor()
-    logging.info("✅ Connected to MySQL database")
-except Error as e:
-    logging.error(f"❌ Failed to connect to MySQL: {e}")
-    exit(1)
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def readline(self, size=-1):
+        data = self.stream.readline(size)
+        self.bytes_read += len(data)
+        return data
+
+    def __iter__(self):
+        return iter(self.readline, b"")
 
 def get_access_tables():
     """Get a list of tables in the Access database."""
@@ -40,114 +97,378 @@ def get_access_tables():
         logging.error(f"❌ Failed to get Access tables: {e}")
         return []
 
-def get_table_columns(table_name):
-    """Get a list of columns for a table in the Access database."""
-    try:
-        result = subprocess.run(["mdb-schema", access_db_path, "mysql"], capture_output=True, text=True)
-        schema_lines = result.stdout.split("\n")
-        
-        columns = []
-        inside_table = False
-
-        for line in schema_lines:
-            line = line.strip()
-            if line.lower().startswith(f"create table `{table_name.lower()}`"):
-                inside_table = True
-            elif inside_table and line == ");":
-                break
-            elif inside_table and line:
-                col_name = line.split()[0].strip("`")
-                columns.append(col_name)
-
-        logging.info(f"📋 Found columns for table {table_name}: {columns}")
-        return columns
-    except Exception as e:
-        logging.error(f"❌ Failed to get columns for table {table_name}: {e}")
-        return []
+def map_column_type(type_spec):
+    """Map a column type from mdb-schema (e.g. "varchar (30)", "Long Integer") to a MySQL type."""
+    match = re.match(r"([A-Za-z /]+?)\s*(?:\(([\d\s,]+)\))?(?:\s+NOT NULL)?$", type_spec.strip(), re.IGNORECASE)
+    base = match.group(1).strip().lower() if match else type_spec.strip().lower()
+    size = match.group(2).replace(" ", "") if match and match.group(2) else None
+
+    mysql_type = MYSQL_TYPES.get(base)
+    if mysql_type is None:
+        logging.warning(f"⚠️ Unknown column type '{type_spec}', using TEXT")
+        return "TEXT"
+    if mysql_type == "TEXT" and size:
+        # "text (n)" is a sized string column; MySQL cannot index unsized TEXT
+        return f"VARCHAR({size})"
+    if mysql_type in SIZED_TYPES and size:
+        return f"{mysql_type}({size})"
+    if mysql_type == "VARCHAR":
+        return "VARCHAR(255)"
+    return mysql_type
 
-def create_mysql_table(table_name, columns):
-    """Create a MySQL table with the given columns."""
-    if not columns:
+def load_schema_catalog():
+    """Run mdb-schema once and parse every table into {table: {columns, primary_key, indexes}}.
+
+    Column lines are the backquoted names inside CREATE TABLE; keys come from
+    the ALTER TABLE ... ADD PRIMARY KEY / ADD INDEX statements that follow.
+    """
+    result = subprocess.run(["mdb-schema", access_db_path, "mysql"], capture_output=True, text=True, check=True)
+
+    catalog = {}
+    current = None
+    for line in result.stdout.split("\n"):
+        line = line.strip()
+        create = re.match(r"CREATE TABLE `([^`]+)`", line, re.IGNORECASE)
+        key = re.match(r"ALTER TABLE `([^`]+)` ADD (PRIMARY KEY|UNIQUE INDEX|UNIQUE|INDEX)[^(]*\((.+)\)\s*;", line, re.IGNORECASE)
+        if create:
+            current = {"columns": [], "primary_key": [], "indexes": []}
+            catalog[create.group(1)] = current
+        elif current is not None and line.startswith(")"):
+            current = None
+        elif current is not None and line.startswith("`"):
+            column = re.match(r"`([^`]+)`\s+(.+?),?$", line)
+            current["columns"].append((column.group(1), map_column_type(column.group(2))))
+        elif key and key.group(1) in catalog:
+            key_columns = re.findall(r"`([^`]+)`", key.group(3))
+            if key.group(2).upper() == "PRIMARY KEY":
+                catalog[key.group(1)]["primary_key"] = key_columns
+            else:
+                catalog[key.group(1)]["indexes"].append(key_columns)
+
+    logging.info(f"📋 Parsed schema for {len(catalog)} tables")
+    return catalog
+
+def get_table_schema(catalog, table_name):
+    """Look up a table in the schema catalog, ignoring case like the old DDL scan did."""
+    if table_name in catalog:
+        return catalog[table_name]
+    for name, schema in catalog.items():
+        if name.lower() == table_name.lower():
+            return schema
+    return None
+
+def create_mysql_table(conn, table_name, schema):
+    """Create a typed MySQL table with its primary key and indexes. Returns True if the table is ready."""
+    if not schema or not schema["columns"]:
         logging.warning(f"⚠️ No columns found for table {table_name}. Skipping...")
-        return
+        return False
+
+    types = dict(schema["columns"])
+
+    def key_part(col):
+        # BLOB/TEXT columns can only be indexed on a prefix
+        return f"`{col}`(255)" if types.get(col, "").endswith(("TEXT", "BLOB")) else f"`{col}`"
 
     try:
-        col_defs = ", ".join([f"`{col}` TEXT" for col in columns])
-        create_stmt = f"CREATE TABLE IF NOT EXISTS `{table_name}` ({col_defs})"
-        mysql_cursor.execute(create_stmt)
-        mysql_conn.commit()
+        col_defs = [f"`{col}` {col_type}" for col, col_type in schema["columns"]]
+        if schema["primary_key"]:
+            col_defs.append(f"PRIMARY KEY ({', '.join(key_part(col) for col in schema['primary_key'])})")
+        for index_columns in schema["indexes"]:
+            if index_columns != schema["primary_key"]:
+                col_defs.append(f"INDEX ({', '.join(key_part(col) for col in index_columns)})")
+        create_stmt = f"CREATE TABLE IF NOT EXISTS `{table_name}` ({', '.join(col_defs)})"
+        with conn.cursor() as cursor:
+            cursor.execute(create_stmt)
+        conn.commit()
         logging.info(f"✅ Created table: {table_name}")
+        return True
     except Error as e:
         logging.error(f"❌ Failed to create table {table_name}: {e}")
+        return False
 
-def transfer_table_data(table_name):
-    """Transfer data from an Access table to a MySQL table."""
+def source_signature():
+    """Size and modification time of the Access file; progress recorded for another file is not resumed."""
     try:
-        result = subprocess.run(["mdb-export", access_db_path, table_name], capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            logging.error(f"❌ Failed to export data from table {table_name}. Skipping...")
-            return
+        stat = os.stat(access_db_path)
+    except OSError:
+        return None
+    return f"{stat.st_size}:{int(stat.st_mtime)}"
 
-        csv_data = StringIO(result.stdout)  # Use StringIO here
-        df = pd.read_csv(csv_data)
+def ensure_ledger(conn):
+    """Create the progress ledger table if needed."""
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS `{LEDGER_TABLE}` (
+                `table_name` VARCHAR(64) NOT NULL PRIMARY KEY,
+                `source` VARCHAR(64) NULL,
+                `status` VARCHAR(16) NOT NULL,
+                `rows_done` BIGINT NOT NULL DEFAULT 0,
+                `chunks_done` INT NOT NULL DEFAULT 0,
+                `started_at` DATETIME NOT NULL,
+                `updated_at` DATETIME NOT NULL,
+                `finished_at` DATETIME NULL
+            )
+        """)
+    conn.commit()
 
-        if df.empty:
-            logging.warning(f"⚠️ Skipping empty table: {table_name}")
-            return
+def get_progress(conn, table_name):
+    """Return the ledger entry of a table as a dict, or None if it has not been started from this Access file."""
+    with conn.cursor(dictionary=True) as cursor:
+        cursor.execute(f"SELECT * FROM `{LEDGER_TABLE}` WHERE `table_name` = %s", (table_name,))
+        progress = cursor.fetchone()
+    if progress is not None and progress["source"] != source_signature():
+        logging.warning(f"⚠️ {table_name}: progress was recorded for another Access file; importing it again")
+        return None
+    return progress
 
-        df = df.where(pd.notnull(df), None)
+def start_table(conn, table_name):
+    """Record that a table's import starts from its first row."""
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            REPLACE INTO `{LEDGER_TABLE}` (`table_name`, `source`, `status`, `rows_done`, `chunks_done`, `started_at`, `updated_at`)
+            VALUES (%s, %s, 'running', 0, 0, NOW(), NOW())
+        """, (table_name, source_signature()))
+    conn.commit()
 
-        # Prepare SQL query to insert data
-        placeholders = ", ".join(["%s"] * len(df.columns))
-        columns = ", ".join([f"`{col}`" for col in df.columns])
-        sql = f"INSERT INTO `{table_name}` ({columns}) VALUES ({placeholders})"
+def record_chunk(conn, table_name, rows_done):
+    """Advance a table's progress to rows_done in the current transaction; the caller commits it with the rows."""
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE `{LEDGER_TABLE}` SET `rows_done` = %s, `chunks_done` = `chunks_done` + 1, `updated_at` = NOW()
+            WHERE `table_name` = %s
+        """, (rows_done, table_name))
 
-        # Insert data row by row
-        for _, row in df.iterrows():
-            row_tuple = tuple(None if pd.isna(value) else value for value in row)
-            mysql_cursor.execute(sql, row_tuple)
+def finish_table(conn, table_name):
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE `{LEDGER_TABLE}` SET `status` = 'done', `updated_at` = NOW(), `finished_at` = NOW()
+            WHERE `table_name` = %s
+        """, (table_name,))
+    conn.commit()
 
-        mysql_conn.commit()
-        logging.info(f"✅ Data transferred: {table_name}")
-    except Error as e:
-        logging.error(f"❌ Failed to transfer data for table {table_name}: {e}")
+def clear_ledger(conn):
+    """Forget all progress, so that every table is imported again from its first row."""
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM `{LEDGER_TABLE}`")
+    conn.commit()
+
+def prepare_frame(df):
+    """Convert a DataFrame to MySQL-ready values column by column (NaN -> None)."""
+    df = df.copy()
+    for col in df.columns:
+        # The dtype plan is made from the first chunk, so an integer column that was all NULL there
+        # stays float in the later chunks; send its values as 1, not 1.0
+        values = whole_floats_to_int(df[col])
+        df[col] = values.astype(object).where(values.notna(), None)
+    return df
+
+def insert_rows(conn, table_name, df):
+    """Insert a prepared DataFrame with multi-row INSERTs in the current transaction."""
+    placeholders = ", ".join(["%s"] * len(df.columns))
+    columns = ", ".join([f"`{col}`" for col in df.columns])
+    sql = f"INSERT INTO `{table_name}` ({columns}) VALUES ({placeholders})"
+
+    with conn.cursor() as cursor:
+        for start in range(0, len(df), BATCH_SIZE):
+            batch = df.iloc[start:start + BATCH_SIZE]
+            # executemany rewrites an INSERT into a single multi-row VALUES statement
+            cursor.executemany(sql, list(batch.itertuples(index=False, name=None)))
+            increment("round_trips")
 
-def remove_column_if_exists():
-    """Remove the column '(' from all MySQL tables if it exists."""
+def mysql_escape(values):
+    """Escape a column of values for a LOAD DATA tab-separated file (None -> \\N)."""
+    text = values.astype(str)
+    for char, escaped in (("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r")):
+        text = text.str.replace(char, escaped, regex=False)
+    return text.where(values.notna(), "\\N")
+
+def load_data_rows(conn, table_name, df):
+    """Insert a prepared DataFrame with LOAD DATA LOCAL INFILE, one spooled file per BATCH_SIZE rows, in the current transaction."""
+    columns = ", ".join([f"`{col}`" for col in df.columns])
+    sql = f"LOAD DATA LOCAL INFILE %s INTO TABLE `{table_name}` ({columns})"
+
+    with conn.cursor() as cursor:
+        for start in range(0, len(df), BATCH_SIZE):
+            batch = df.iloc[start:start + BATCH_SIZE]
+            escaped = [mysql_escape(batch[col]) for col in batch.columns]
+            lines = escaped[0]
+            for column in escaped[1:]:
+                lines = lines + "\t" + column
+
+            with tempfile.NamedTemporaryFile("w", suffix=".tsv", encoding="utf-8", delete=False) as spool:
+                spool.write("\n".join(lines) + "\n")
+            try:
+                cursor.execute(sql, (spool.name,))
+                increment("round_trips")
+            finally:
+                os.remove(spool.name)
+
+def load_csv_stream(conn, table_name, stream, skip_rows=0):
+    """Parse CSV rows from a binary stream COMMIT_SIZE rows at a time and insert each chunk.
+
+    Each chunk is committed together with the table's progress in the ledger.
+    The first skip_rows rows, committed by an earlier run, are parsed but not
+    inserted. With conn set to None the rows are only parsed and prepared.
+    Returns the number of rows inserted.
+    """
+    rows = 0
+    offset = 0
+    # Dates stay strings: mysql-connector cannot bind pandas Timestamps
+    planner = DtypePlanner(table_name, parse_dates=False)
+    try:
+        for chunk in planner.apply(pd.read_csv(stream, chunksize=COMMIT_SIZE, encoding="utf-8")):
+            end = offset + len(chunk)
+            if end <= skip_rows:
+                offset = end
+                continue
+            chunk = prepare_frame(chunk.iloc[max(skip_rows - offset, 0):])
+            if conn is not None:
+                if USE_LOAD_DATA:
+                    load_data_rows(conn, table_name, chunk)
+                else:
+                    insert_rows(conn, table_name, chunk)
+                record_chunk(conn, table_name, end)
+                conn.commit()
+            rows += len(chunk)
+            offset = end
+    except pd.errors.EmptyDataError:
+        pass  # no output at all
+    if rows:
+        planner.report()
+    return rows
+
+def transfer_table_data(conn, table_name, skip_rows=0):
+    """Stream data from an Access table into a MySQL table.
+
+    mdb-export's output is read from a pipe and parsed COMMIT_SIZE rows at a
+    time, so memory stays bounded by the chunk size rather than the table size.
+    The first skip_rows rows were committed by an earlier run and are not inserted again.
+    Returns a (rows, bytes) tuple; raises if the transfer fails.
+    """
+    rows = 0
+    # ISO dates so that DATE/DATETIME columns accept the exported values
+    command = ["mdb-export", "-D", "%Y-%m-%d", "-T", "%Y-%m-%d %H:%M:%S", access_db_path, table_name]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    stream = CountingReader(process.stdout)
     try:
-        mysql_cursor.execute("SHOW TABLES")
-        tables = [table[0] for table in mysql_cursor.fetchall()]
-
-        for table in tables:
-            mysql_cursor.execute(f"SHOW COLUMNS FROM `{table}`")
-            columns = [col[0] for col in mysql_cursor.fetchall()]
-            
-            if "(" in columns:
-                logging.warning(f"⚠️ Column '(' found in table {table}. Dropping it...")
-                mysql_cursor.execute(f"ALTER TABLE `{table}` DROP COLUMN `(`")
-                mysql_conn.commit()
-                logging.info(f"✅ Column '(' dropped from table {table}")
+        rows = load_csv_stream(conn, table_name, stream, skip_rows)
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+
+    if returncode != 0:
+        raise RuntimeError(f"mdb-export exited with code {returncode} after {rows} rows")
+
+    increment("bytes", stream.bytes_read)
+
+    if rows == 0 and skip_rows == 0:
+        logging.warning(f"⚠️ Empty table: {table_name}")
+    return rows, stream.bytes_read
+
+def import_table(pool, catalog, table_name):
+    """Create and fill one MySQL table on a pooled connection. Errors are reported, not raised."""
+    logging.info(f"🔄 Processing table: {table_name}")
+    start_time = time.monotonic()
+    summary = {"table": table_name, "status": "ok", "rows": 0, "bytes": 0, "error": None}
+    try:
+        conn = pool.get_connection()
+        try:
+            progress = get_progress(conn, table_name)
+            if progress is not None and progress["status"] == "done":
+                logging.info(f"⏭️ {table_name} was already imported ({progress['rows_done']} rows)")
+                summary["status"] = "done"
+            elif create_mysql_table(conn, table_name, get_table_schema(catalog, table_name)):
+                if progress is None:
+                    # Rows not covered by the ledger (an import without it, or from another file) are replaced
+                    with conn.cursor() as cursor:
+                        cursor.execute(f"TRUNCATE TABLE `{table_name}`")
+                    start_table(conn, table_name)
+                    skip_rows = 0
+                else:
+                    skip_rows = progress["rows_done"]
+                    logging.info(f"🔁 Resuming {table_name} after {skip_rows} committed rows")
+                summary["rows"], summary["bytes"] = transfer_table_data(conn, table_name, skip_rows)
+                finish_table(conn, table_name)
             else:
-                logging.info(f"✅ No column '(' found in table {table}")
-    except Error as e:
-        logging.error(f"❌ Failed to remove column '(': {e}")
+                summary["status"] = "skipped"
+        except Exception:
+            conn.rollback()  # the chunk in progress; committed chunks stay recorded in the ledger
+            raise
+        finally:
+            conn.close()  # returns the connection to the pool
+    except Exception as e:
+        summary["status"] = "failed"
+        summary["error"] = str(e)
+        logging.error(f"❌ Failed to transfer data for table {table_name}: {e}")
+
+    summary["elapsed"] = time.monotonic() - start_time
+    if summary["status"] == "ok":
+        rate = summary["rows"] / summary["elapsed"] if summary["elapsed"] > 0 else 0
+        logging.info(f"✅ Data transferred: {table_name} ({summary['rows']} rows in {summary['elapsed']:.2f}s, {rate:,.0f} rows/s)")
+    return summary
+
+def log_summary(summaries, elapsed):
+    """Log one line per table with rows, bytes and elapsed time."""
+    logging.info(f"📊 Import summary ({len(summaries)} tables, {elapsed:.2f}s wall time):")
+    for summary in sorted(summaries, key=lambda item: item["elapsed"], reverse=True):
+        line = (f"   {summary['table']:<24} {summary['status']:<8} {summary['rows']:>10} rows "
+                f"{summary['bytes'] / 1e6:>10.2f} MB {summary['elapsed']:>8.2f}s")
+        if summary["error"]:
+            line += f"  {summary['error']}"
+        logging.info(line)
+
+def main():
+    """Import all Access tables into MySQL, WORKERS tables at a time, resuming an interrupted import."""
+    parser = argparse.ArgumentParser(description="Import the Access database into MySQL.")
+    parser.add_argument("--restart", action="store_true", help="ignore the progress ledger and import every table again")
+    args = parser.parse_args()
+
+    tables = get_access_tables()
+    if not tables:
+        logging.error("❌ No tables found in the Access database.")
+        return
 
-# Main script
-tables = get_access_tables()
+    try:
+        catalog = load_schema_catalog()
+    except Exception as e:
+        logging.error(f"❌ Failed to read the Access schema: {e}")
+        return
+
+    try:
+        pool = MySQLConnectionPool(pool_name="access_import", pool_size=WORKERS, **mysql_config)
+        logging.info(f"✅ Connected to MySQL database ({WORKERS} pooled connections)")
+        conn = pool.get_connection()
+        try:
+            ensure_ledger(conn)
+            if args.restart:
+                clear_ledger(conn)
+        finally:
+            conn.close()
+    except Error as e:
+        logging.error(f"❌ Failed to connect to MySQL: {e}")
+        exit(1)
 
-if not tables:
-    logging.error("❌ No tables found in the Access database.")
-else:
-    for table in tables:
-        logging.info(f"🔄 Processing table: {table}")
-        columns = get_table_columns(table)
-        create_mysql_table(table, columns)
-        transfer_table_data(table)
+    # The import's stage row goes to the run-summary table of the MySQL database it fills
+    run_id = f"import__{datetime.now(timezone.utc).isoformat(timespec='seconds')}"
+    summary_engine = create_engine(URL.create(
+        "mysql+mysqlconnector", username=mysql_config["user"], password=mysql_config["password"],
+        host=mysql_config["host"], port=int(mysql_config["port"]), database=mysql_config["database"],
+    ))
 
-remove_column_if_exists()
+    start_time = time.monotonic()
+    # Tables run concurrently and share the process-wide counters, so the import is one stage;
+    # the per-table figures are in the summary below
+    with stage("import", run_id, summary_engine) as metrics:
+        with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+            summaries = list(executor.map(lambda table: import_table(pool, catalog, table), tables))
+        metrics.rows_in = metrics.rows_out = sum(summary["rows"] for summary in summaries)
 
-mysql_cursor.close()
-mysql_conn.close()
+    log_summary(summaries, time.monotonic() - start_time)
+    failed = [summary["table"] for summary in summaries if summary["status"] == "failed"]
+    if failed:
+        logging.error(f"❌ Data migration finished with failed tables: {failed}. Run again to resume them.")
+    else:
+        logging.info("🎉 Data migration completed successfully!")
 
-logging.info("🎉 Data migration completed successfully!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()